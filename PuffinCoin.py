@@ -1,77 +1,90 @@
 from threading import Thread
-import logging
 import time
 import json
+import os
 import socket
+import sys
 
-from puffincoin.node import Node
 from puffincoin.blockchain import Blockchain
-from puffincoin.portforward import forwardPort, get_my_ip
+from puffincoin.difficulty import block_work
 from puffincoin.utils import Utils
 
 inputString = ""
 
+f = open("config.json", "r")
+config = json.load(f)
 
-def save_blockchain(blockchain):
-    while True:
-        try:
-            with open("blockchain.json", "w") as f:
-                payload = blockchain.to_json()
-                json.dump(payload, f)
-        except Exception:
-            pass
+light_config = config.get("light_wallet", {})
+light = "--light" in sys.argv or light_config.get("enabled", False) #Use full nodes instead of keeping the chain
 
-        time.sleep(1)
 
+if light:
+    from puffincoin.lightwallet import LightWallet
 
+    print("[INFO] Starting light wallet...")
+    light_wallet = LightWallet(
+        config["seed_nodes"],
+        quorum=light_config.get("quorum", 2),
+        max_nodes=light_config.get("max_nodes", 8)
+        )
 
-#Forward port
-local_ip = get_my_ip()
-result = forwardPort(8222, 8222, "192.168.1.1", local_ip, False, "TCP", 0, None, False)
+    if not light_wallet.connect():
+        print("\n[ERROR] Could not connect to any seed nodes.")
+        time.sleep(10)
+        exit()
 
-if not result:
-    print("[P2P ERROR] Could not forward port with UPnP. Make sure your router has it enebled.")
-    time.sleep(10)
-    exit()
 else:
-    print("[INFO] Forwarded port 8222 with UPnP")
+    from puffincoin.node import Node
+    from puffincoin.blockstore import BlockStore
+    from puffincoin.mining import MiningService
+    from puffincoin.portforward import forwardPort, get_my_ip
+
+    #Forward port
+    local_ip = get_my_ip()
+    result = forwardPort(8222, 8222, "192.168.1.1", local_ip, False, "TCP", 0, None, False)
+
+    if not result:
+        print("[P2P ERROR] Could not forward port with UPnP. Make sure your router has it enebled.")
+        time.sleep(10)
+        exit()
+    else:
+        print("[INFO] Forwarded port 8222 with UPnP")
 
 
-#Create blockchain
-blockchain = Blockchain()
+    #Create blockchain
+    blockchain = Blockchain()
 
-f = open("config.json", "r")
-config = json.load(f)
 
+    #Load saved blockchain
+    store = BlockStore("blocks.dat", blockchain.block_to_json, blockchain.block_from_json)
 
-#Load saved blockchain
-try:
-    data = json.load(open("blockchain.json", "r"))
-    blockchain.chain = blockchain.from_json(data)
-except Exception:
-    pass
+    if len(store) == 0 and os.path.exists("blockchain.json") and os.stat("blockchain.json").st_size > 0:
+        print("[INFO] Importing blockchain.json...")
+        try:
+            store.import_json("blockchain.json", blockchain.validate_chain)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            print("[ERROR] Could not import blockchain.json: " + str(e))
+            store.truncate(0)
 
+    blockchain.attach_store(store, "checkpoint.dat")
 
-print("[INFO] Starting node...")
-n = Node(blockchain)
-Thread(target=n.start).start() #Start node
-Thread(target=n.update_chain_loop).start()
-Thread(target=save_blockchain, args=(blockchain,)).start()
 
-log = logging.getLogger('werkzeug') #Disable logging
-log.disabled = True
-time.sleep(0.4)
+    print("[INFO] Starting node...")
+    n = Node(blockchain)
+    Thread(target=n.start, kwargs=config.get("server", {})).start() #Start node
+    Thread(target=n.update_chain_loop, daemon=True).start()
+    time.sleep(0.4)
 
-print("[INFO] Adding seed node(s)...")
+    print("[INFO] Adding seed node(s)...")
 
-result = blockchain.add_nodes(config["seed_nodes"]) #Add seed nodes
+    result = blockchain.add_nodes(config["seed_nodes"]) #Add seed nodes
 
-if not result:
-    print("\n[ERROR] Could not connect to any seed nodes.")
-    print("If you continue, changes made to the blockchain may not be saved.")
-    opt = input("Do you wish to continue? y/n :")
-    if opt.lower() == 'n':
-        exit()
+    if not result:
+        print("\n[ERROR] Could not connect to any seed nodes.")
+        print("If you continue, changes made to the blockchain may not be saved.")
+        opt = input("Do you wish to continue? y/n :")
+        if opt.lower() == 'n':
+            exit()
 
 print('\n')
 
@@ -82,7 +95,7 @@ try: #Read wallet file
     keys = json.loads(f.read())
 except: #If there is no wallet, generate new one
     print("[INFO] Generating wallet...")
-    keys = blockchain.generate_keys()
+    keys = Blockchain.generate_keys()
     print("""
   ___ __  __ ___  ___  ___ _____ _   _  _ _____ _ 
  |_ _|  \/  | _ \/ _ \| _ \_   _/_\ | \| |_   _| |
@@ -115,8 +128,24 @@ Welcome!
 
 """)
 
+def test_hashrate(target=None):
+    print("Testing...")
+
+    rates = []
+    for i in range(1,10):
+        rates.append(Utils.test_hashrate())
+    rate = sum(rates) / len(rates) * (os.cpu_count() or 1) #The miner uses every core
+
+    print("Your hashrate: ~" + str(round(rate / 1000000, 4)) + " MH/s")
+    if target is None:
+        return
+
+    block_time = block_work(target) / rate
+    print("Block time: ~" + str(round(block_time, 4)) + "s")
+
 def menu():
     exit = False
+    mining = MiningService(blockchain, keys["public_key"])
     while not exit:
         opt = input("""
 MENU
@@ -124,7 +153,8 @@ MENU
 w) Wallet
 t) Transfer PFC
 h) Transaction history
-m) Mine PFC
+m) Start or stop mining PFC
+s) Mining status
 e) Exit the Program
 
 1| Display blockchain
@@ -134,6 +164,7 @@ e) Exit the Program
 5| Add a peer
 6| PuffinCoin version
 7| Test hashrate
+8| Export blockchain to blockchain.json
 
 >> """)
 
@@ -146,18 +177,28 @@ e) Exit the Program
         elif opt.lower() == 't': #Add transaction
             amt = input("How much PFC would you like to send?: ")
             reciever = input("Paste the wallet address of the recipient: ")
-            blockchain.add_transaction(keys["private_key"], keys["public_key"], reciever, amt)
-            print("Transaction added!")
-
-        elif opt.lower() == 'm': #Mine transactions
-            print("Press CTRL+C to stop")
-            
-            print("Mining now...")
-            while True:
-                try:
-                    blockchain.mine_transactions(keys["public_key"])
-                except KeyboardInterrupt:
-                    break
+            fee = input("Fee for the miner, higher fees are mined sooner (empty for none): ") or 0
+            if blockchain.add_transaction(keys["private_key"], keys["public_key"], reciever, amt, fee):
+                print("Transaction added!")
+
+        elif opt.lower() == 'm': #Start or stop mining in the background
+            if mining.running:
+                mining.stop()
+                print("Stopped mining.")
+            else:
+                mining.start()
+                print("Mining in the background, press m again to stop")
+
+        elif opt.lower() == 's': #Mining status
+            status = mining.status()
+            print("Mining: " + ("yes" if status['running'] else "no"))
+            if status['height'] is not None:
+                print("Block: " + str(status['height']) + " (" + str(status['transactions']) + " transactions)")
+            print("Hashrate: " + str(round(status['hashrate'] / 1000, 1)) + " kH/s")
+            for worker, hashrate in enumerate(status['worker_hashrates']):
+                print("  Worker " + str(worker) + ": " + str(round(hashrate / 1000, 1)) + " kH/s")
+            print("Blocks found: " + str(status['blocks_found']))
+            print("Stale work: " + str(status['stale_work']) + " of " + str(status['templates']) + " templates")
 
         elif opt.lower() == 'h': #Transaction history
             transactions = blockchain.get_transaction_history(keys["public_key"])
@@ -173,12 +214,12 @@ e) Exit the Program
             print("Balance: " + str(blockchain.get_balance(wallet)) + "PFC")
 
         elif opt.lower() == '3': #Pending transactions
-            for transaction in blockchain.pending_transactions:
+            for transaction in blockchain.mempool:
                 print(transaction)
 
         elif opt.lower() == '4': #Display connected peers
             for node in blockchain.peers:
-                print(node)
+                print(node + "  " + str(blockchain.client.get_stats(node)))
 
         elif opt.lower() == '5': #Add peer
             addr = input("Type the address of a PuffinCoin node: ")
@@ -189,25 +230,99 @@ e) Exit the Program
             print(blockchain.VER)
 
         elif opt.lower() == '7': #Test hashrate
-            print("Testing...")
-
-            rates = []
-            for i in range(1,10):
-                rates.append(Utils.test_hashrate())
-            rate = sum(rates) / len(rates)
+            test_hashrate(blockchain.get_last_block().target)
 
-            print("Your hashrate: ~" + str(round(rate / 1000000, 4)) + " GH/s")
-            hashes_for_pfc = 17000000
-            
-            block_time = hashes_for_pfc / rate
-            print("Block time: ~" + str(round(block_time, 4)) + "s")
 
+        elif opt.lower() == '8': #Export blockchain
+            blockchain.export_json("blockchain.json")
+            print("Exported " + str(len(blockchain.chain)) + " blocks.")
         
         elif opt.lower() == 'e':
+            mining.stop()
             exit = True
             
         else:
             print("Invalid input! Please try again.")
 
+def light_menu():
+    exit = False
+    while not exit:
+        opt = input("""
+MENU (light wallet)
+
+w) Wallet
+t) Transfer PFC
+h) Transaction history
+e) Exit the Program
+
+2| Check balance of a wallet
+4| Display connected nodes
+5| Add a node
+6| PuffinCoin version
+7| Test hashrate
+
+>> """)
+
+        print('\n')
+
+        if opt.lower() == 'w': #Display public key (wallet address)
+            balance = light_wallet.get_balance(keys["public_key"])
+            print("Wallet: " + keys["public_key"])
+            if balance is not None:
+                print("Current balance: " + str(balance) + "PFC")
+
+        elif opt.lower() == 't': #Send transaction to full nodes
+            amt = input("How much PFC would you like to send?: ")
+            reciever = input("Paste the wallet address of the recipient: ")
+            fee = input("Fee for the miner, higher fees are mined sooner (empty for none): ") or 0
+            if light_wallet.send(keys["private_key"], keys["public_key"], reciever, amt, fee):
+                print("Transaction sent!")
+
+        elif opt.lower() == 'h': #Transaction history
+            transactions = light_wallet.get_transaction_history(keys["public_key"])
+
+            for height, transaction in transactions or []:
+                print(transaction.__str__().replace(keys["public_key"], "You") + "  (block " + str(height) + ")")
+
+        elif opt.lower() == '2': #Check balance
+            wallet = input("Paste a wallet address: ")
+            balance = light_wallet.get_balance(wallet)
+            if balance is not None:
+                print("Balance: " + str(balance) + "PFC")
+
+        elif opt.lower() == '4': #Display connected nodes
+            for node in light_wallet.nodes:
+                print(node + "  " + str(light_wallet.client.get_stats(node)))
+
+        elif opt.lower() == '5': #Add node
+            addr = input("Type the address of a PuffinCoin node: ")
+            light_wallet.add_node(addr)
+            print("Added.")
+
+        elif opt.lower() == '6': #Version
+            print(Blockchain.VER)
+
+        elif opt.lower() == '7': #Test hashrate
+            test_hashrate()
+
+        elif opt.lower() == 'e':
+            exit = True
+
+        else:
+            print("Invalid input! Please try again.")
+
+if light:
+    light_menu()
+
+    print("[INFO] Stopping light wallet...")
+    light_wallet.close()
+    quit()
+
 menu()
+
+print("[INFO] Stopping node...")
+n.stop()
+blockchain.save_checkpoint()
+blockchain.client.close()
+blockchain.miner.stop()
 quit()
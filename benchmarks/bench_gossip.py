@@ -0,0 +1,110 @@
+"""
+Measures how long a new block takes to reach every node of a local
+network that only uses gossip (no polling).
+
+Each node connects to a few earlier nodes, so blocks have to travel over
+several hops. Every round one node mines a block on its tip and the time
+until each other node has it is recorded.
+
+Usage: python -m benchmarks.bench_gossip [nodes] [rounds]
+"""
+
+import random
+import statistics
+import sys
+import threading
+import time
+
+from benchmarks.synthetic import make_blockchain, make_wallets
+from puffincoin.blockchain import Block, Transaction
+from puffincoin.encoding import now
+from puffincoin.validation import ChainValidator
+from puffincoin.node import Node
+
+BASE_PORT = 8400
+
+
+def start_network(amount, degree=2, seed=0):
+    """
+    Starts nodes on localhost, each connected to up to degree earlier nodes
+
+    :return: List of blockchains
+    """
+
+    rng = random.Random(seed)
+    blockchains = []
+
+    for i in range(amount):
+        blockchain = make_blockchain("127.0.0.1", BASE_PORT + i)
+        if blockchains:
+            blockchain.load_chain(blockchains[0].chain[:1]) #Same genesis block everywhere
+        node = Node(blockchain)
+        threading.Thread(target=node.start, kwargs={"host": "127.0.0.1", "port": blockchain.port}, daemon=True).start()
+        blockchains.append(blockchain)
+
+    time.sleep(0.5)
+    for i, blockchain in enumerate(blockchains[1:], 1):
+        peers = rng.sample(blockchains[:i], min(degree, i))
+        blockchain.add_nodes([peer.address for peer in peers])
+
+    return blockchains
+
+
+def mine_block(blockchain, reciever):
+    median_time = ChainValidator(blockchain.miner_reward).median_time(blockchain.chain[-1], blockchain.chain.__getitem__)
+    block = Block(
+        [Transaction("Miner Reward", reciever, blockchain.miner_reward)], max(now(), median_time + 1), len(blockchain.chain)
+        )
+    block.prev = blockchain.chain[-1].hash
+    block.target = blockchain.next_target(block, blockchain.chain[-1])
+    block.mine()
+    return block
+
+
+def main(amount, rounds):
+    blockchains = start_network(amount)
+    wallet = make_wallets(1)[0][1]
+
+    links = sum(len(blockchain.peers) for blockchain in blockchains) // 2
+    print(f"{amount} nodes, {links} links")
+
+    latencies = []
+    slowest = []
+    for round in range(rounds):
+        miner = blockchains[round % amount]
+        block = mine_block(miner, wallet)
+        height = block.index
+
+        start = time.perf_counter()
+        miner.add_block(block)
+        miner.gossip.announce_block(block)
+
+        arrived = {id(miner): 0}
+        while len(arrived) < amount and time.perf_counter() - start < 10:
+            for blockchain in blockchains:
+                if id(blockchain) not in arrived and len(blockchain.chain) > height:
+                    arrived[id(blockchain)] = time.perf_counter() - start
+            time.sleep(0.001)
+
+        if len(arrived) < amount:
+            print(f"[ERROR] Round {round}: block reached {len(arrived)}/{amount} nodes")
+            return
+
+        times = [t for t in arrived.values() if t > 0]
+        latencies += times
+        slowest.append(max(times))
+
+    print(f"mean latency:     {statistics.mean(latencies) * 1000:>8.1f} ms")
+    print(f"median latency:   {statistics.median(latencies) * 1000:>8.1f} ms")
+    print(f"all nodes (mean): {statistics.mean(slowest) * 1000:>8.1f} ms")
+    print(f"all nodes (max):  {max(slowest) * 1000:>8.1f} ms")
+
+    for blockchain in blockchains:
+        blockchain.client.close()
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20
+        )
@@ -0,0 +1,52 @@
+"""
+Compares block hashing attempts per second of Block.hash_block with the
+midstate path used by the miner.
+
+Usage: python -m benchmarks.bench_hashing [seconds]
+"""
+
+import sys
+import time
+
+from benchmarks.synthetic import make_chain
+
+
+def rate(attempt, seconds):
+    nonse = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        for i in range(1000):
+            attempt(nonse)
+            nonse += 1
+    return nonse / seconds
+
+
+def main(seconds):
+    block = make_chain(10)[1]
+
+    midstate = block.header_midstate()
+    for nonse in range(1000):
+        block.nonse = nonse
+        if block.hash_nonse(midstate, nonse) != block.hash_block():
+            print("[ERROR] Midstate hash differs at nonse " + str(nonse))
+            return
+
+    def hash_block(nonse):
+        block.nonse = nonse
+        block.hash_block()
+
+    def hash_midstate(nonse):
+        header = midstate.copy()
+        header.update(b'%d"' % nonse)
+        header.digest()
+
+    old = rate(hash_block, seconds)
+    new = rate(hash_midstate, seconds)
+
+    print(f"hash_block: {old:>12.0f} attempts/s")
+    print(f"midstate:   {new:>12.0f} attempts/s")
+    print(f"speedup:    {new / old:>12.2f}x")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2)
@@ -0,0 +1,89 @@
+"""
+Measures memory used by transactions loaded with Blockchain.from_json,
+compared with keeping the json fields as attributes of plain objects.
+
+Usage: python -m benchmarks.bench_memory [tx amount]
+"""
+
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from benchmarks.synthetic import make_blockchain, make_wallets
+from puffincoin.encoding import format_time
+
+
+class PlainObject():
+    """Dict backed object like Block and Transaction were before __slots__"""
+
+    def __init__(self, fields):
+        self.__dict__.update(fields)
+
+
+def make_json(tx_amount, block_size=10, seed=0):
+    rng = random.Random(seed)
+    addresses = [public_key for private_key, public_key in make_wallets(100, seed)]
+    start = 1609459200
+
+    blocks = []
+    for index in range(tx_amount // block_size):
+        transactions = []
+        for i in range(block_size):
+            transactions.append({
+                'sender': rng.choice(addresses),
+                'reciever': rng.choice(addresses),
+                'amount': rng.randrange(1, 1000),
+                'time': format_time(start + index),
+                'hash': os.urandom(32).hex(),
+                'signature': os.urandom(64).hex()
+            })
+
+        blocks.append({
+            'index': index,
+            'time': format_time(start + index),
+            'prev': os.urandom(32).hex(),
+            'nonse': rng.randrange(10 ** 7),
+            'hash': os.urandom(32).hex(),
+            'transactions': transactions
+        })
+    return blocks
+
+
+def measure(name, load, text, tx_amount):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    blocks = load(json.loads(text))
+    gc.collect()
+    elapsed = time.perf_counter() - start
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{name:<16} {used / 2 ** 20:>10.1f} MiB {used / tx_amount:>8.0f} bytes/tx {elapsed:>8.2f}s")
+    return blocks
+
+
+def main(tx_amount):
+    blockchain = make_blockchain()
+    text = json.dumps(make_json(tx_amount))
+
+    def load_plain(blocks_json):
+        blocks = []
+        for block_json in blocks_json:
+            block = PlainObject(block_json)
+            block.transactions = [PlainObject(tx) for tx in block_json['transactions']]
+            blocks.append(block)
+        return blocks
+
+    print(f"{tx_amount} transactions")
+    plain = measure("dict objects", load_plain, text, tx_amount)
+    del plain
+    measure("slotted objects", blockchain.from_json, text, tx_amount)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,51 @@
+"""
+Compares signatures verified per second by the per-transaction path
+(Transaction.verify_signature) and SignatureVerifier batches.
+
+Usage: python -m benchmarks.bench_signatures [tx amount] [processes]
+"""
+
+import os
+import sys
+import time
+
+from benchmarks.synthetic import make_chain
+from puffincoin.sigverify import SignatureVerifier
+
+
+def measure(name, verify, transactions):
+    start = time.perf_counter()
+    verify(transactions)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<22} {len(transactions) / elapsed:>12.0f} sigs/s")
+
+
+def main(tx_amount, processes):
+    chain = make_chain(tx_amount)
+    transactions = [tx for block in chain for tx in block.transactions if tx.sender != 'Miner Reward']
+    print(f"{len(transactions)} signed transactions")
+
+    def per_tx(transactions):
+        for transaction in transactions:
+            assert transaction.verify_signature() is None
+
+    def batch(transactions):
+        assert all(SignatureVerifier().verify_batch(transactions))
+
+    pool = SignatureVerifier(processes=processes)
+
+    def batch_pool(transactions):
+        assert all(pool.verify_batch(transactions))
+
+    measure("per transaction", per_tx, transactions)
+    measure("batch", batch, transactions)
+    measure(f"batch, {processes} processes", batch_pool, transactions)
+    measure("batch, already verified", batch_pool, transactions)
+    pool.close()
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+        )
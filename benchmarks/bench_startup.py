@@ -0,0 +1,77 @@
+"""
+Measures how long loading a saved chain takes at startup, for chains of
+growing size:
+
+  json        parsing blockchain.json with from_json and replaying it
+  store       opening the block store and replaying every block
+  checkpoint  opening the block store with a checkpoint near the tip
+
+Usage: python -m benchmarks.bench_startup [tx amounts...]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import make_blockchain, make_chain
+from puffincoin.blockchain import Block, Transaction
+from puffincoin.blockstore import BlockStore
+
+
+def timed(load):
+    start = time.perf_counter()
+    blockchain = load()
+    elapsed = time.perf_counter() - start
+    if blockchain.store is not None:
+        blockchain.store.close()
+    return elapsed
+
+
+def main(sizes):
+    print(f"{'transactions':>12} {'blocks':>8} {'json':>10} {'store':>10} {'checkpoint':>10}")
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, "blockchain.json")
+            store_path = os.path.join(directory, "blocks.dat")
+            checkpoint_path = os.path.join(directory, "checkpoint.dat")
+
+            blockchain = make_blockchain()
+            blockchain.load_chain(make_chain(size))
+            blockchain.export_json(json_path)
+
+            store = BlockStore(store_path, blockchain.block_to_json, blockchain.block_from_json)
+            blockchain.attach_store(store, checkpoint_path)
+            blockchain.save_checkpoint()
+
+            #A few blocks after the checkpoint, like a node that stopped between checkpoints
+            for i in range(10):
+                block = Block([Transaction("Miner Reward", "ab" * 32, 5)], "01-01-2021 00:00:00", len(blockchain.chain))
+                block.prev = blockchain.chain[-1].hash
+                block.hash = block.hash_block()
+                blockchain.add_block(block)
+            blocks = len(blockchain.chain)
+            store.close()
+
+            def load_json():
+                loaded = make_blockchain()
+                with open(json_path) as f:
+                    loaded.load_chain(loaded.from_json(json.load(f)))
+                return loaded
+
+            def load_store(path=None):
+                loaded = make_blockchain()
+                loaded.attach_store(BlockStore(store_path, loaded.block_to_json, loaded.block_from_json), path)
+                return loaded
+
+            json_time = timed(load_json)
+            store_time = timed(load_store)
+            checkpoint_time = timed(lambda: load_store(checkpoint_path))
+
+        print(f"{size:>12} {blocks:>8} {json_time:>9.3f}s {store_time:>9.3f}s {checkpoint_time:>9.3f}s")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,62 @@
+"""
+Compares the initial sync of a new node using block downloads from one
+peer against headers-first sync with block bodies from several peers.
+
+Usage: python -m benchmarks.bench_sync [transactions] [peers]
+"""
+
+import sys
+import threading
+import time
+
+from benchmarks.synthetic import make_blockchain, make_chain
+from puffincoin.node import Node
+
+BASE_PORT = 8480
+
+
+def start_peers(chain, amount):
+    peers = []
+    for i in range(amount):
+        blockchain = make_blockchain("127.0.0.1", BASE_PORT + i)
+        blockchain.load_chain(chain)
+        node = Node(blockchain)
+        threading.Thread(target=node.start, kwargs={"host": "127.0.0.1", "port": blockchain.port}, daemon=True).start()
+        peers.append(blockchain)
+
+    time.sleep(0.5)
+    return peers
+
+
+def new_node(chain, port):
+    blockchain = make_blockchain("127.0.0.1", port)
+    blockchain.load_chain(chain[:1])
+    return blockchain
+
+
+def main(tx_amount, peer_amount):
+    chain = make_chain(tx_amount)
+    peers = start_peers(chain, peer_amount)
+    addresses = [peer.address for peer in peers]
+    print(f"{len(chain)} blocks, {peer_amount} peers")
+
+    blockchain = new_node(chain, BASE_PORT + peer_amount)
+    blockchain.add_nodes(addresses[:1])
+    start = time.perf_counter()
+    blockchain.client.run(blockchain.sync_chain(addresses[0]))
+    print(f"blocks from one peer: {time.perf_counter() - start:.2f}s, height {len(blockchain.chain)}")
+    blockchain.client.close()
+
+    blockchain = new_node(chain, BASE_PORT + peer_amount + 1)
+    blockchain.add_nodes(addresses)
+    start = time.perf_counter()
+    blockchain.client.run(blockchain.sync_headers(addresses[0], addresses))
+    print(f"headers first:        {time.perf_counter() - start:.2f}s, height {len(blockchain.chain)}")
+    blockchain.client.close()
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 50000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    )
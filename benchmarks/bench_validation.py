@@ -0,0 +1,32 @@
+"""
+Measures Blockchain.validate_chain on synthetic chains of growing size.
+
+Usage: python -m benchmarks.bench_validation [tx amounts...]
+"""
+
+import sys
+import time
+
+from benchmarks.synthetic import make_blockchain, make_chain
+
+
+def main(sizes):
+    blockchain = make_blockchain()
+
+    print(f"{'transactions':>12} {'blocks':>8} {'seconds':>10} {'us/tx':>8}")
+    for size in sizes:
+        chain = make_chain(size)
+
+        start = time.perf_counter()
+        result = blockchain.validate_chain(chain)
+        elapsed = time.perf_counter() - start
+
+        if not result:
+            print("[ERROR] Synthetic chain is not valid: " + str(result))
+            return
+
+        print(f"{size:>12} {len(chain):>8} {elapsed:>10.3f} {elapsed / size * 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,131 @@
+"""
+Measures requests per second the node API serves on /chain, /transactions
+and /peers.
+
+Without --node a node with a synthetic chain and mempool is started in a
+separate process, so the load generator does not compete with it for the GIL.
+
+Usage: python -m benchmarks.loadtest [--node host:port] [--seconds 5] [--concurrency 32] [--threads 8]
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import statistics
+import time
+
+import aiohttp
+
+from benchmarks.synthetic import make_blockchain, make_chain, make_wallets
+from puffincoin.blockchain import Transaction
+from puffincoin.node import Node
+
+ENDPOINTS = ["/chain", "/transactions", "/peers"]
+
+
+def serve(port, threads, tx_amount):
+    logging.getLogger("waitress.queue").setLevel(logging.ERROR) #Queued requests are expected under load
+    blockchain = make_blockchain("127.0.0.1", port)
+    blockchain.load_chain(make_chain(tx_amount))
+
+    wallets = make_wallets(100)
+    for private_key, public_key in wallets:
+        transaction = Transaction(public_key, wallets[0][1], 1, nonce=blockchain.ledger.next_nonce(public_key))
+        transaction.sign(private_key)
+        blockchain.mempool.add(transaction)
+    for i in range(50):
+        blockchain.peers.add(f"198.51.100.{i}:8222")
+
+    Node(blockchain).start("127.0.0.1", port, threads=threads)
+
+
+async def load(node, path, seconds, concurrency, headers):
+    """
+    Sends requests from concurrency keep-alive connections for some seconds
+
+    :return: (requests, failures, list of latencies)
+    """
+
+    latencies = []
+    failures = 0
+    end = time.perf_counter() + seconds
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector, auto_decompress=False) as session:
+        async def worker():
+            nonlocal failures
+            while time.perf_counter() < end:
+                start = time.perf_counter()
+                try:
+                    async with session.get(f"http://{node}{path}", headers=headers) as response:
+                        await response.read()
+                        if response.status not in (200, 304):
+                            failures += 1
+                            continue
+                except aiohttp.ClientError:
+                    failures += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*[worker() for i in range(concurrency)])
+
+    return len(latencies), failures, latencies
+
+
+async def wait_for(node, timeout=30):
+    end = time.perf_counter() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.perf_counter() < end:
+            try:
+                async with session.get(f"http://{node}/version") as response:
+                    if response.status == 200:
+                        return True
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.1)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the node API")
+    parser.add_argument("--node", help="Address of a running node, default starts a local one")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=8, help="Request threads of the local node")
+    parser.add_argument("--transactions", type=int, default=10000, help="Transactions in the local node's chain")
+    args = parser.parse_args()
+
+    process = None
+    node = args.node
+    if node is None:
+        node = "127.0.0.1:8450"
+        process = multiprocessing.Process(target=serve, args=(8450, args.threads, args.transactions), daemon=True)
+        process.start()
+
+    try:
+        if not asyncio.run(wait_for(node)):
+            print("[ERROR] Node at " + node + " is not responding")
+            return
+
+        print(f"{node}  concurrency: {args.concurrency}  seconds: {args.seconds}")
+        for path in ENDPOINTS:
+            for name, headers in (("", {"Accept-Encoding": "identity"}), (" gzip", {"Accept-Encoding": "gzip"})):
+                requests, failures, latencies = asyncio.run(load(node, path, args.seconds, args.concurrency, headers))
+                if not latencies:
+                    print(f"{path + name:<20} no successful requests, {failures} failed")
+                    continue
+
+                latencies.sort()
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                print(
+                    f"{path + name:<20} {requests / args.seconds:>9.0f} req/s"
+                    f"  median {statistics.median(latencies) * 1000:>7.1f} ms"
+                    f"  p99 {p99 * 1000:>7.1f} ms  failed {failures}"
+                    )
+    finally:
+        if process is not None:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Runs the node's benchmarks on one synthetic chain and writes the results
+as JSON, so runs can be compared across commits:
+
+  hashing        block hashing attempts per second, Block.hash_block and the miner's midstate search
+  validation     Blockchain.is_valid on the whole chain
+  serialization  Blockchain.to_json and from_json of the whole chain
+  balance        Blockchain.get_balance lookups
+  mempool        adding, selecting and removing pending transactions
+  sync           a new node syncing from local peers, block by block and headers first
+
+The chain and the mempool transactions only depend on --transactions and
+--seed, so runs with the same arguments measure the same work.
+
+Usage: python -m benchmarks.suite [--transactions 20000] [--seed 0] [--seconds 1] [--peers 3] [--only hashing ...] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+
+from benchmarks.bench_hashing import rate
+from benchmarks.bench_sync import new_node, start_peers
+from benchmarks.synthetic import GENESIS_TIME, make_blockchain, make_chain, make_wallets, stamp
+from puffincoin.blockchain import Transaction
+from puffincoin.mempool import Mempool
+from puffincoin.utils import Utils
+
+BENCHMARKS = ["hashing", "validation", "serialization", "balance", "mempool", "sync"]
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def bench_hashing(args, chain, blockchain):
+    block = make_chain(10, seed=args.seed)[1] #Not a block of the chain, its nonse changes
+
+    def hash_block(nonse):
+        block.nonse = nonse
+        block.hash_block()
+
+    return {
+        'hash_block_per_s': rate(hash_block, args.seconds),
+        'search_per_s': Utils.test_hashrate(args.seconds)
+    }
+
+
+def bench_validation(args, chain, blockchain):
+    valid, seconds = timed(lambda: blockchain.is_valid(chain))
+    return {
+        'valid': valid,
+        'seconds': seconds,
+        'us_per_tx': seconds / args.transactions * 1e6
+    }
+
+
+def bench_serialization(args, chain, blockchain):
+    chain_json, to_json_seconds = timed(blockchain.to_json)
+    text = json.dumps(chain_json)
+    loaded, from_json_seconds = timed(lambda: blockchain.from_json(json.loads(text)))
+
+    return {
+        'bytes': len(text),
+        'to_json_seconds': to_json_seconds,
+        'from_json_seconds': from_json_seconds,
+        'round_trip': loaded[-1].hash == chain[-1].hash
+    }
+
+
+def bench_balance(args, chain, blockchain):
+    rng = random.Random(args.seed)
+    addresses = [public_key for private_key, public_key in make_wallets(100, args.seed)]
+    lookups = [rng.choice(addresses) for i in range(100000)]
+
+    def look_up():
+        for address in lookups:
+            blockchain.get_balance(address)
+
+    result, seconds = timed(look_up)
+    return {'lookups_per_s': len(lookups) / seconds}
+
+
+def make_pending(amount, seed):
+    """
+    Creates unsigned transfers with random fees, in nonce order for every
+    sender. The mempool does not check signatures.
+
+    :return: List of transactions
+    """
+
+    rng = random.Random(seed)
+    addresses = [public_key for private_key, public_key in make_wallets(100, seed)]
+    nonces = {}
+
+    transactions = []
+    for i in range(amount):
+        sender = rng.choice(addresses)
+        nonce = nonces.get(sender, 0)
+        nonces[sender] = nonce + 1
+        transactions.append(stamp(
+            Transaction(sender, rng.choice(addresses), rng.randrange(1, 100), rng.randrange(0, 50), nonce),
+            GENESIS_TIME
+            ))
+    return transactions
+
+
+def bench_mempool(args, chain, blockchain):
+    transactions = make_pending(min(args.transactions, 10000), args.seed)
+    mempool = Mempool(max_size=len(transactions), max_chain=len(transactions))
+
+    def add():
+        for transaction in transactions:
+            mempool.add(transaction, None, 0)
+
+    def take():
+        for i in range(1000):
+            mempool.take(blockchain.block_size)
+
+    def remove():
+        while len(mempool):
+            for transaction in mempool.take(blockchain.block_size):
+                mempool.remove(transaction.hash)
+
+    result, add_seconds = timed(add)
+    added = len(mempool)
+    result, take_seconds = timed(take)
+    result, remove_seconds = timed(remove)
+
+    return {
+        'transactions': added,
+        'adds_per_s': added / add_seconds,
+        'takes_per_s': 1000 / take_seconds,
+        'removes_per_s': added / remove_seconds
+    }
+
+
+def bench_sync(args, chain, blockchain):
+    peers = start_peers(chain, args.peers)
+    addresses = [peer.address for peer in peers]
+    port = peers[-1].port + 1
+
+    def sync(node, download):
+        node.add_nodes(addresses)
+        result, seconds = timed(lambda: node.client.run(download(node)))
+        height = len(node.chain)
+        node.client.close()
+        return seconds, height
+
+    one_peer, one_peer_height = sync(new_node(chain, port), lambda node: node.sync_chain(addresses[0]))
+    headers_first, headers_first_height = sync(
+        new_node(chain, port + 1), lambda node: node.sync_headers(addresses[0], addresses)
+        )
+
+    for peer in peers:
+        peer.client.close()
+
+    return {
+        'peers': args.peers,
+        'one_peer_seconds': one_peer,
+        'headers_first_seconds': headers_first,
+        'synced': one_peer_height == len(chain) and headers_first_height == len(chain)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the node on a synthetic chain")
+    parser.add_argument("--transactions", type=int, default=20000, help="Transactions in the synthetic chain")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--seconds", type=float, default=1, help="Seconds each hashing benchmark runs")
+    parser.add_argument("--peers", type=int, default=3, help="Local peers the sync benchmark starts")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="Benchmarks to run, default all")
+    parser.add_argument("--output", help="File the JSON results are written to, default stdout")
+    args = parser.parse_args()
+
+    chain = make_chain(args.transactions, seed=args.seed)
+    blockchain = make_blockchain()
+    blockchain.load_chain(chain)
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        print(f"[INFO] Running {name}...")
+        results[name] = globals()["bench_" + name](args, chain, blockchain)
+        for key, value in results[name].items():
+            print(f"  {key:<24} {value:.6g}" if isinstance(value, float) else f"  {key:<24} {value}")
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'arguments': {key: value for key, value in vars(args).items() if key != "output"},
+        'chain': {'blocks': len(chain), 'transactions': args.transactions, 'tip': chain[-1].hash},
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("[INFO] Wrote results to " + args.output)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import random
+
+import nacl.encoding
+import nacl.signing
+
+from puffincoin.blockchain import Blockchain, Block, Transaction
+from puffincoin.difficulty import MAX_TARGET, TARGET_SPACING, Retarget
+from puffincoin.encoding import format_time, parse_time
+
+GENESIS_TIME = "01-01-2021 00:00:00"
+
+
+def make_blockchain(public_ip="192.0.2.1", port=8222):
+    """
+    Creates a Blockchain without looking up the public ip. Any hash is
+    enough proof of work, so synthetic blocks do not need to be mined.
+
+    :param public_ip: Address the node announces itself with
+    :param port: Port the node is reachable on
+    :return: Blockchain
+    """
+
+    blockchain = Blockchain(public_ip=public_ip, port=port)
+    blockchain.retarget = Retarget(initial_target=MAX_TARGET)
+    return blockchain
+
+
+def make_wallets(amount, seed=0):
+    """
+    Creates deterministic wallets
+
+    :param amount: Amount of wallets
+    :param seed: Random seed
+    :return: List of (private key, public key) hex tuples
+    """
+
+    rng = random.Random(seed)
+    wallets = []
+    for i in range(amount):
+        signing_key = nacl.signing.SigningKey(rng.randbytes(32))
+        wallets.append((
+            signing_key.encode(encoder=nacl.encoding.HexEncoder).decode(),
+            signing_key.verify_key.encode(encoder=nacl.encoding.HexEncoder).decode()
+        ))
+    return wallets
+
+
+def stamp(transaction, time):
+    transaction.time = time
+    transaction.hash = transaction.hash_transaction()
+    return transaction
+
+
+def make_chain(tx_amount, block_size=10, wallet_amount=100, seed=0):
+    """
+    Creates a valid chain of signed transactions between synthetic wallets
+
+    Each block starts with a miner reward funding a wallet, the rest of the
+    block are 1 PFC transfers from wallets that can afford them. Blocks are
+    TARGET_SPACING seconds apart and use the easiest target, so the target
+    never changes. Transactions get the time of their block, so the same
+    arguments always give the same chain.
+
+    :param tx_amount: Amount of transactions in the chain
+    :param block_size: Transactions per block
+    :param wallet_amount: Amount of wallets sending transactions
+    :param seed: Random seed
+    :return: List of blocks starting at a genesis block
+    """
+
+    rng = random.Random(seed)
+    wallets = make_wallets(wallet_amount, seed)
+    balances = [0] * wallet_amount
+    nonces = [0] * wallet_amount
+
+    genesis = Block([], GENESIS_TIME, 0, target=MAX_TARGET)
+    chain = [genesis]
+    made = 0
+
+    while made < tx_amount:
+        time = format_time(parse_time(GENESIS_TIME) + len(chain) * TARGET_SPACING)
+        reciever = rng.randrange(wallet_amount)
+        transactions = [stamp(Transaction("Miner Reward", wallets[reciever][1], 5), time)]
+        balances[reciever] += 5
+        made += 1
+
+        funded = [w for w in range(wallet_amount) if balances[w] > 0]
+        while len(transactions) < block_size and made < tx_amount and funded:
+            sender = rng.choice(funded)
+            reciever = rng.randrange(wallet_amount)
+            transaction = stamp(Transaction(wallets[sender][1], wallets[reciever][1], 1, nonce=nonces[sender]), time)
+            transaction.sign(wallets[sender][0])
+            nonces[sender] += 1
+            balances[sender] -= 1
+            balances[reciever] += 1
+            if not balances[sender]:
+                funded.remove(sender)
+
+            transactions.append(transaction)
+            made += 1
+
+        block = Block(transactions, time, len(chain), target=MAX_TARGET)
+        block.prev = chain[-1].hash
+        block.hash = block.hash_block()
+        chain.append(block)
+
+    return chain
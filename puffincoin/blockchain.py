@@ -1,37 +1,82 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import asyncio
+import contextlib
 import hashlib
 import json
-from datetime import datetime
+import os
 import time
 import requests
 import urllib.request
 
 import nacl.encoding
+import nacl.exceptions
 import nacl.signing
 
-class Blockchain():
-    def __init__(self):
-        self.VER = "0.5.2"
+from puffincoin.encoding import (
+    MINER_REWARD, now, parse_time, format_time, hash_to_bytes,
+    address_to_bytes, address_from_bytes, signature_to_bytes
+    )
+from puffincoin.blocktree import BlockTree
+from puffincoin.chain import Chain
+from puffincoin.checkpoint import CHECKPOINT_INTERVAL, load_checkpoint, save_checkpoint
+from puffincoin.difficulty import INITIAL_TARGET, RETARGET_VERSION, Retarget, chain_work, target_from_hex, target_to_hex
+from puffincoin.gossip import Gossip
+from puffincoin.ledger import Ledger
+from puffincoin.mempool import Mempool
+from puffincoin.merkle import MerkleTree
+from puffincoin.miner import Miner, search
+from puffincoin.peers import PeerClient
+from puffincoin.rwlock import RWLock
+from puffincoin.sigverify import SignatureVerifier
+from puffincoin.snapshot import ChainSnapshot
+from puffincoin.streaming import encode_json, json_list
+from puffincoin.validation import BLOCK_VERSION, ChainValidator
+
+BLOCKS_LIMIT = 500 #Most blocks sent in one /blocks response
+HEADERS_LIMIT = 2000 #Most headers sent in one /headers response
+BODY_WINDOW = 100 #Blocks downloaded in one request during headers-first sync
+HEADERS_FIRST_GAP = BLOCKS_LIMIT #Blocks behind a peer before syncing headers first
+FORK_PROBE = 16 #Blocks or headers requested at each step back while looking for a fork
+HISTORY_LIMIT = 1000 #Most transactions sent in one /history response
 
-        self.chain = [self.add_genesis_block()]
-        self.pending_transactions = []
-        self.difficulty = 6
+class Blockchain():
+    VER = "0.8.0"
+
+    def __init__(self, public_ip=None, port=8222):
+        self.lock = RWLock() #Held for writing while the chain, ledger or mempool change
+        self.chain = Chain(blocks=[self.add_genesis_block()])
+        self.ledger = Ledger()
+        self.ledger.apply_block(self.chain[0])
+        self.tree = BlockTree()
+        self.store = None
+        self.checkpoint_path = None
+        self.mempool = Mempool()
+        self.retarget = Retarget()
         self.miner_reward = 5
         self.block_size = 10
         self.peers = set([])
+        self.client = PeerClient()
+        self.miner = Miner()
+        self.verifier = SignatureVerifier()
+        self.gossip = Gossip(self)
+        self.port = port
         
-        ip = self.get_public_ip()
+        ip = public_ip or self.get_public_ip()
         if ip: self.public_ip = ip
         else:
             print("\n[ERROR] Could not get public ip")
             input()
             exit()
 
+    @property
+    def address(self):
+        return self.public_ip + ":" + str(self.port)
+
     def __str__(self):
         return_str = ''
-        for block in self.chain:
+        for block in self.snapshot():
             try:
                 return_str += block.__str__() + '\n'
             except TypeError:
@@ -49,67 +94,84 @@ class Blockchain():
         :return: True if sucessfully added over 1 node
         """
 
-        connected_nodes_amt = 0
+        had_peers = len(self.peers) > 0
+        connected_nodes_amt, update = self.client.run(self.add_nodes_async(nodes))
 
-        for node in nodes:
-            if self.public_ip in node or node in self.peers:
-                continue
+        if not had_peers and len(self.peers) == 0 and update is not None:
+            if update:
+                print("[INFO] You are not on the latest version of PuffinCoin. Visit https://github.com/PuffinDev/PuffinCoin to update. IMPORTANT: save the wallet.json file.")
+                time.sleep(500)
+                exit()
+            else:
+                print("[INFO] Seed node is using an outdated version of PuffinCoin.")
+                time.sleep(500)
+                exit()
 
+        if connected_nodes_amt > 0:
+            return True
+        else:
+            return False
 
-            try:
-                ver = requests.get("http://" + node + "/version", timeout=4).text
-            except Exception:
+    async def add_nodes_async(self, nodes):
+        """
+        Appends new nodes to self.peers, contacting all of them at once
+
+        :param nodes: Addresses of the nodes to add (list)
+        :return: (amount of nodes registered at, None if no node had another
+                  version, otherwise True if a node had a newer version)
+        """
+
+        nodes = [node for node in set(nodes) if not (node == self.address or node in self.peers)]
+        responses = await asyncio.gather(*[self.client.get(node, "/version") for node in nodes])
+
+        new_nodes = []
+        update = None
+        for node, response in zip(nodes, responses):
+            if response is None or response[0] != 200:
                 print("[INFO] Could not recive version from: " + "http://" + node + "/version")
                 continue
 
+            ver = response[1].decode(errors="replace")
             if ver == self.VER:
                 self.peers.add(node)
-                try: #Register as a node
-                    requests.post("http://" + node + "/register", self.public_ip + ":8222", timeout=4)
-                    connected_nodes_amt += 1
-                except Exception:
-                    print("[INFO] Could register at: " + "http://" + node + "/register")
-                    continue
-            
-            else:
-                try:
-                    release, feature, patch = ver.split(".")
-                    own_release, own_feature, own_patch = self.VER.split(".")
-                except Exception:
-                    print("[INFO] Could not parse version: " + ver)
-                    continue
+                new_nodes.append(node)
+                continue
+
+            try:
+                release, feature, patch = ver.split(".")
+                own_release, own_feature, own_patch = self.VER.split(".")
+            except Exception:
+                print("[INFO] Could not parse version: " + ver)
+                continue
 
+            if release > own_release:
+                update = True
+            elif feature > own_feature:
+                update = True
+            elif patch > own_patch:
+                update = True
+            else:
+                update = bool(update)
 
-                if release > own_release:
-                    update = True
-                elif feature > own_feature:
-                    update = True
-                elif patch > own_patch:
-                    update = True
+            if self.peers:
+                if update:
+                    print("[INFO] Could not add node, please update to the latest version of PuffinCoin")
                 else:
-                    update = False
-                
-                if len(self.peers) == 0:
+                    print("[INFO] Node is using outdated version of PuffinCoin.")
 
-                    if update:
-                        print("[INFO] You are not on the latest version of PuffinCoin. Visit https://github.com/PuffinDev/PuffinCoin to update. IMPORTANT: save the wallet.json file.")
-                        time.sleep(500)
-                        exit()
-                    else:
-                        print("[INFO] Seed node is using an outdated version of PuffinCoin.")
-                        time.sleep(500)
-                        exit()
+        #Register as a node
+        responses = await asyncio.gather(*[
+            self.client.post(node, "/register", self.address) for node in new_nodes
+            ])
 
-                else:
-                    if update:
-                        print("[INFO] Could not add node, please update to the latest version of PuffinCoin")
-                    else:
-                        print("[INFO] Node is using outdated version of PuffinCoin.")
+        connected_nodes_amt = 0
+        for node, response in zip(new_nodes, responses):
+            if response is None:
+                print("[INFO] Could register at: " + "http://" + node + "/register")
+            else:
+                connected_nodes_amt += 1
 
-        if connected_nodes_amt > 0:
-            return True
-        else:
-            return False
+        return connected_nodes_amt, update
 
 
     def get_public_ip(self):
@@ -141,107 +203,510 @@ class Blockchain():
 
     def update_chain(self):
         """
-        Replaces chain with longest in network
+        Switches to the chain with the most work in the network
+
+        :return: None
+        """
+
+        self.client.run(self.update_chain_async())
+
+    async def update_chain_async(self):
+        """
+        Polls all peers at once for new peers, their tip and pending transactions,
+        then downloads the new blocks of the longest chain
 
         :return: None
         """
 
         #Get new peers
-        new_peers = []
+        peers = [node for node in self.peers if self.client.available(node)]
+        peer_lists = await asyncio.gather(*[self.client.get_json(node, "/peers") for node in peers])
+
+        new_peers = set()
+        for peer_list in peer_lists:
+            if not isinstance(peer_list, list):
+                continue
+            for node in peer_list:
+                if not node in self.peers:
+                    if node != self.address:
+                        new_peers.add(node)
+
+        if new_peers:
+            await self.add_nodes_async(new_peers)
+
+        #Get tips and pending transactions
+        peers = [node for node in self.peers if self.client.available(node)]
+        tips, transactions_json = await asyncio.gather(
+            asyncio.gather(*[self.client.get_json(node, "/tip") for node in peers]),
+            asyncio.gather(*[self.client.get_json(node, "/transactions", conditional=True) for node in peers])
+            )
+
+        #Update blockchain from the highest peers first
+        candidates = []
+        for node, tip in zip(peers, tips):
+            if isinstance(tip, dict) and isinstance(tip.get("height"), int) and tip["height"] >= len(self.chain):
+                candidates.append((tip["height"], node))
+
+        for height, node in sorted(candidates, reverse=True):
+            if height < len(self.chain):
+                break
+
+            if height - len(self.chain) >= HEADERS_FIRST_GAP:
+                synced = await self.sync_headers(node, [peer for peer_height, peer in candidates if peer_height >= height])
+            else:
+                synced = await self.sync_chain(node)
+
+            if synced:
+                #Transactions skipped before the new blocks arrived may be valid now
+                self.client.forget_etags("/transactions")
+                self.gossip.announce_block(self.chain[-1], exclude=node)
+                break
+
+        #Recieve pending transactions
+        loop = asyncio.get_running_loop()
+        for node, transaction_list in zip(peers, transactions_json):
+            if not isinstance(transaction_list, list):
+                continue
 
-        peers = self.peers
-        for node in peers:
             try:
-                response = requests.get(f'http://{node}/peers', timeout=4)
-            except:
+                transactions = self.pending_transactions_from_json(transaction_list)
+            except (KeyError, TypeError, ValueError):
                 continue
 
-            if response.status_code == 200:
-                for node in response.json():
-                    if not node in self.peers:
-                        if not self.public_ip in node:
-                            new_peers.append(node)
+            added = await loop.run_in_executor(None, self.receive_transactions, transactions)
+            self.gossip.announce_transactions(added, exclude=node)
 
-        self.add_nodes(new_peers)
+    def receive_transactions(self, transactions):
+        """
+        Adds the valid transfers received from a peer to the mempool. Miner
+        rewards are not signed, so they are never taken from peers.
 
+        :param transactions: List of transactions
+        :return: List of the transactions that were added
+        """
 
+        with self.lock.read():
+            transactions = [
+                tx for tx in transactions
+                if tx.raw_sender is not None and tx.hash not in self.mempool and not self.ledger.has_transaction(tx)
+                ]
+        #A sender's transactions are only accepted in nonce order
+        transactions.sort(key=lambda tx: -1 if tx.nonce is None else tx.nonce)
+        self.verifier.verify_batch(transactions) #Outside the lock, the results are cached for check
+
+        added = []
+        with self.lock.write():
+            for tx in transactions:
+                balance = self.get_balance(tx.sender) - self.mempool.pending_spend(tx.sender)
+                if not tx.check(balance, self.miner_reward, self.verifier):
+                    if self.mempool.add(tx, self.get_balance(tx.sender), self.ledger.next_nonce(tx.sender)):
+                        added.append(tx)
+        return added
+
+    async def get_peer_blocks(self, node, start, limit=None):
+        """
+        Downloads the blocks of a peer from a height up to its tip
 
-        #Update blockchain
-        for node in self.peers:
-            own_chain_length = len(self.chain)
+        :param node: Address of the peer
+        :param start: Height of the first block
+        :param limit: Most blocks to download in a single request, None for all of them
+        :return: List of blocks, or None if the request failed
+        """
 
-            try:
-                response = requests.get(f'http://{node}/chain', timeout=4)
-            except:
-                continue
+        if limit is not None:
+            return await self.client.get_json_list(node, "/blocks", {"from": start, "limit": limit}, self.block_from_json)
 
-            if response.status_code == 200:
-                length = len(response.json()['chain'])
-                chain = self.from_json(response.json()['chain'])
+        blocks = []
+        while True:
+            received = await self.client.get_json_list(
+                node, "/blocks", {"from": start + len(blocks)}, self.block_from_json
+                )
+            if received is None:
+                return None
 
-                if length > own_chain_length and self.is_valid(chain, self):
-                    self.chain = chain
+            blocks += received
+            if len(received) < BLOCKS_LIMIT:
+                return blocks
 
+    async def get_peer_headers(self, node, start, limit=None):
+        """
+        Downloads the block headers of a peer from a height up to its tip
 
-            #Recieve pending transactions
-            try:
-                response = requests.get(f'http://{node}/transactions', timeout=4)
-            except:
-                continue
-        
-            if response.status_code == 200:
-                try:
-                    transactions = self.pending_transactions_from_json(response.json())
-                except json.JSONDecodeError:
-                    print("Could not decode json:")
-                    print(response.text)
+        :param node: Address of the peer
+        :param start: Height of the first header
+        :param limit: Most headers to download in a single request, None for all of them
+        :return: List of BlockHeaders, or None if the request failed
+        """
+
+        if limit is not None:
+            return await self.client.get_json_list(node, "/headers", {"from": start, "limit": limit}, self.header_from_json)
+
+        headers = []
+        while True:
+            received = await self.client.get_json_list(
+                node, "/headers", {"from": start + len(headers)}, self.header_from_json
+                )
+            if received is None:
+                return None
+
+            headers += received
+            if len(received) < HEADERS_LIMIT:
+                return headers
+
+    async def find_fork(self, chain, node, download):
+        """
+        Steps back from the tip until what a peer sends connects to the
+        chain. Each step only downloads a short page, the rest of the peer's
+        chain is downloaded once the fork is found.
+
+        :param chain: ChainSnapshot
+        :param node: Address of the peer
+        :param download: get_peer_blocks or get_peer_headers
+        :return: (height of the first differing block, blocks or headers from there),
+                 or (None, None) if the download failed
+        """
+
+        back = 1
+        start = len(chain)
+        while True:
+            items = await download(node, start, FORK_PROBE)
+            if not items:
+                return None, None
+
+            fork = start
+            for item in items:
+                if fork >= len(chain) or chain[fork].raw_hash != item.raw_hash:
+                    break
+                fork += 1
+
+            if fork > start or start == 0 or items[0].raw_prev == chain[start - 1].raw_hash:
+                break
+
+            back *= 2
+            start = max(0, len(chain) - back)
+
+        if len(items) >= FORK_PROBE: #The page may not have reached the tip
+            rest = await download(node, start + len(items))
+            if rest is None:
+                return None, None
+            items += rest
+        return fork, items[fork - start:]
+
+    async def sync_chain(self, node):
+        """
+        Downloads the blocks a peer has after the last block both chains
+        share, and switches to them if they have more work than the blocks
+        they replace and are valid
+
+        :param node: Address of the peer
+        :return: True if the chain was updated
+        """
+
+        chain = self.snapshot()
+        fork, new_blocks = await self.find_fork(chain, node, self.get_peer_blocks)
+        if fork is None or chain_work(new_blocks) <= chain_work(chain[fork:]):
+            return False
+
+        #Validating and applying blocks is slow, the client's loop keeps serving other peers meanwhile
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.switch_to, node, chain, fork, new_blocks)
+
+    async def sync_headers(self, node, peers):
+        """
+        Syncs with a peer that is far ahead by downloading its headers first.
+        The header chain is checked for linkage and proof of work before any
+        block is downloaded, then the blocks are fetched from several peers
+        at once in windows of BODY_WINDOW blocks.
+
+        :param node: Address of the peer the headers are downloaded from
+        :param peers: Addresses of peers the blocks can be downloaded from
+        :return: True if the chain was updated
+        """
+
+        chain = self.snapshot()
+        fork, headers = await self.find_fork(chain, node, self.get_peer_headers)
+        if fork is None or chain_work(headers) <= chain_work(chain[fork:]):
+            return False
+
+        validator = ChainValidator(self.miner_reward, retarget=self.retarget)
+        loop = asyncio.get_running_loop()
+        if fork == 0:
+            result = await loop.run_in_executor(None, validator.validate_headers, headers[1:], headers[0], headers.__getitem__)
+        else:
+            result = await loop.run_in_executor(None, validator.validate_headers, headers, chain[fork - 1], chain.__getitem__)
+        if not result:
+            print("[INFO] Rejected headers from " + node + ": " + str(result))
+            return False
+
+        if fork < len(chain):
+            #A reorg is only done once the whole new branch is known to be valid
+            new_blocks = []
+            async with contextlib.aclosing(self.download_bodies(headers, peers)) as downloads:
+                async for blocks in downloads:
+                    new_blocks += blocks
+            if len(new_blocks) < len(headers):
+                return False
+            return await loop.run_in_executor(None, self.switch_to, node, chain, fork, new_blocks)
+
+        #Blocks extending the tip are added window by window as they arrive
+        updated = False
+        async with contextlib.aclosing(self.download_bodies(headers, peers)) as downloads:
+            async for blocks in downloads:
+                if not await loop.run_in_executor(None, self.switch_to, node, chain, len(chain), blocks):
+                    break
+                chain = self.snapshot()
+                updated = True
+        return updated
+
+    async def download_bodies(self, headers, peers):
+        """
+        Downloads the blocks of a header chain from several peers at once
+
+        :param headers: BlockHeaders of the blocks
+        :param peers: Addresses of peers to download from
+        :return: Async generator of lists of blocks, in chain order. It stops
+                 early if no peer can send a window.
+        """
+
+        windows = [headers[i:i + BODY_WINDOW] for i in range(0, len(headers), BODY_WINDOW)]
+        queue = list(range(len(windows)))
+        queue.reverse()
+        received = {} # window -> blocks
+        failed = set() # peers that sent nothing or the wrong blocks
+        arrived = asyncio.Event()
+
+        async def download(node):
+            while queue and node not in failed:
+                i = queue.pop()
+                blocks = await self.get_body_window(node, windows[i])
+                if blocks is None:
+                    failed.add(node)
+                    queue.append(i)
+                else:
+                    received[i] = blocks
+                arrived.set()
+
+        tasks = []
+        try:
+            next_window = 0
+            while next_window < len(windows):
+                arrived.clear()
+                if next_window in received:
+                    yield received.pop(next_window)
+                    next_window += 1
                     continue
 
-                for tx in transactions:
-                    exists = False
-                    for pending_tx in self.pending_transactions:
-                        if pending_tx.hash == tx.hash:
-                            exists = True
-                            break
-                    
-                    if not exists:
-                        self.pending_transactions.append(tx)
+                if all(task.done() for task in tasks):
+                    #Start downloads, or restart them for windows given back by failed peers
+                    nodes = [node for node in peers if node not in failed and self.client.available(node)]
+                    if not nodes:
+                        return
+                    tasks = [asyncio.ensure_future(download(node)) for node in nodes for i in range(2)]
+
+                await arrived.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_body_window(self, node, headers):
+        """
+        Downloads the blocks of some headers from a peer
+
+        :param node: Address of the peer
+        :param headers: Consecutive BlockHeaders
+        :return: List of blocks, or None if the request failed or the blocks do not match the headers
+        """
+
+        blocks = await self.client.get_json_list(
+            node, "/blocks", {"from": headers[0].index, "limit": len(headers)}, self.block_from_json
+            )
+        if blocks is None or len(blocks) != len(headers):
+            return None
 
+        for block, header in zip(blocks, headers):
+            if block.raw_hash != header.raw_hash or block.tx_root() != header.raw_root:
+                return None
+        return blocks
 
-            #Remove mined transactions
-            for block in self.chain:
-                for block_tx in block.transactions:
-                    for pending_tx in self.pending_transactions:
-                        if block_tx.hash == pending_tx.hash:
-                            self.pending_transactions.remove(pending_tx)
+    def switch_to(self, node, chain, fork, new_blocks):
+        """
+        Validates blocks from a peer and switches the chain to them
 
-    def is_valid(self, chain, own_chain):
+        :param node: Address of the peer
+        :param chain: ChainSnapshot the blocks were downloaded for
+        :param fork: Height of the first new block
+        :param new_blocks: The blocks
+        :return: True if the chain was updated
+        """
+
+        #Check signatures before taking the lock, validation then finds them in the cache
+        self.verifier.verify_batch([tx for block in new_blocks for tx in block.transactions])
+
+        with self.lock.write():
+            if self.chain[-1].raw_hash != chain.tip.raw_hash:
+                return False #The chain changed while downloading, the next update tries again
+
+            result = self.validate_branch(chain, fork, new_blocks)
+            if not result:
+                print("[INFO] Rejected blocks from " + node + ": " + str(result))
+                return False
+
+            self.reorganize(fork, new_blocks)
+            self.connect_blocks(self.tree.take_orphans(new_blocks[-1].raw_hash))
+        return True
+
+    def validate_branch(self, chain, fork, blocks):
+        """
+        Checks blocks that would replace the blocks of a chain from a height on
+
+        :param chain: The chain, or a ChainSnapshot of it
+        :param fork: Height of the first block
+        :param blocks: The blocks
+        :return: ValidationResult
+        """
+
+        validator = ChainValidator(self.miner_reward, self.verifier, self.retarget)
+        if fork == 0:
+            return validator.validate(blocks)
+
+        offset = self.ledger.block_offsets[fork] if fork < len(chain) else self.ledger.tx_count
+        return validator.validate_blocks(
+            blocks,
+            chain[fork - 1],
+            lambda address: self.ledger.balance_before(address, offset),
+            block_at=chain.__getitem__,
+            nonce_of=lambda address: self.ledger.nonce_before(address, offset)
+            )
+
+    def add_peer_block(self, block):
+        """
+        Adds a block received from a peer. A block extending the tip is
+        appended, a block on another branch is kept in the block tree until
+        its branch has more work than the chain, and a block whose parent is
+        not known yet waits in the orphan pool.
+
+        :param block: The block
+        :return: True if the chain changed
+        """
+
+        with self.lock.write():
+            return self.connect_blocks([block])
+
+    def knows_block(self, block_hash):
+        """
+        :param block_hash: Hash of a block
+        :return: True if the block is in the chain, the block tree or the orphan pool
+        """
+
+        try:
+            raw_hash = hash_to_bytes(block_hash)
+        except ValueError:
+            return False
+
+        with self.lock.read():
+            return raw_hash in self.ledger.block_heights or raw_hash in self.tree
+
+    def connect_blocks(self, blocks):
+        """
+        Connects blocks to the chain or the block tree, followed by the
+        orphans waiting for them. Must be called with the lock held for writing.
+
+        :param blocks: The blocks
+        :return: True if the chain changed
+        """
+
+        changed = False
+        pending = list(blocks)
+        while pending:
+            block = pending.pop()
+            if block.raw_hash in self.ledger.block_heights or block.raw_hash in self.tree:
+                continue
+
+            if block.raw_prev not in self.ledger.block_heights and self.tree.get(block.raw_prev) is None:
+                self.tree.add_orphan(block)
+                continue
+
+            if self.connect_block(block):
+                changed = True
+
+            children = self.tree.take_orphans(block.raw_hash)
+            if block.raw_hash in self.ledger.block_heights or block.raw_hash in self.tree:
+                pending += children #Orphans of a rejected block are dropped with it
+
+        self.tree.prune(len(self.chain) - 1)
+        return changed
+
+    def connect_block(self, block):
+        """
+        Adds a block whose parent is in the chain or the block tree, and
+        switches to its branch if that has more work than the chain. Only
+        the blocks after the fork are rolled back and re-applied.
+
+        :param block: The block
+        :return: True if the chain changed
+        """
+
+        validator = ChainValidator(self.miner_reward, self.verifier, self.retarget)
+        tip = self.chain[-1]
+
+        if block.raw_prev == tip.raw_hash:
+            result = validator.validate_blocks(
+                [block], tip, self.get_balance, block_at=self.chain.__getitem__, nonce_of=self.ledger.next_nonce
+                )
+            if not result:
+                print("[INFO] Rejected block " + block.hash + ": " + str(result))
+                return False
+
+            self.add_block(block)
+            return True
+
+        branch = self.tree.branch(block.raw_prev) + [block]
+        height = self.ledger.block_heights.get(branch[0].raw_prev)
+        if height is None or height < len(self.chain) - 1 - self.tree.max_depth:
+            return False #The branch forks off too deep, or off blocks that were pruned
+        fork = height + 1
+
+        parent = self.chain[fork - 1]
+        block_at = validator.lookup(branch[:-1], parent, self.chain.__getitem__)
+        reason = validator.check_block(block, branch[-2] if len(branch) > 1 else parent, block_at)
+        if reason:
+            print("[INFO] Rejected block " + block.hash + ": " + reason)
+            return False
+
+        self.tree.add(block)
+        if chain_work(branch) <= chain_work(self.chain[fork:]):
+            return False #On equal work the branch seen first is kept
+
+        result = self.validate_branch(self.chain, fork, branch)
+        if not result:
+            print("[INFO] Rejected branch of block " + block.hash + ": " + str(result))
+            self.tree.remove_descendants(branch[result.height - fork].raw_hash)
+            return False
+
+        print("[INFO] Switching to a branch with more work at block " + str(fork))
+        self.reorganize(fork, branch)
+        return True
+
+    def is_valid(self, chain):
         """
         Checks if a chain is valid
 
         :param chain: The chain to be validated
-        :param own_chain: The local chain
-        :return: None
+        :return: True or False
         """
 
-        for i in range(1, len(chain)):
-            block = chain[i]
-            last_block = chain[i-1]
-            
-            if not block.index == 0: #Don't check genesis block
-                if block.prev != last_block.hash: 
-                    #print("[ERROR] Block hash is invalid")
-                    return False
-                
-                if block.hash != block.hash_block():
-                    #print("[ERROR] Block hash is not valid")
-                    return False
+        return bool(self.validate_chain(chain))
 
-                if not block.valid_transactions(own_chain): 
-                    #print("[ERROR] Block transactions are not valid")
-                    return False
+    def validate_chain(self, chain):
+        """
+        Replays a chain once, checking every block and transaction against
+        the chain's own running balances
 
-        return True
+        :param chain: The chain to be validated
+        :return: ValidationResult with the first failing block and reason
+        """
+
+        return ChainValidator(self.miner_reward, self.verifier, self.retarget).validate(chain)
                 
     #BLOCKCHAIN UTILS
 
@@ -253,10 +718,183 @@ class Blockchain():
         """
 
         transactions = []
-        genesis_block = Block(transactions, datetime.now().strftime("%d-%m-%Y %H:%M:%S"), 0)
+        genesis_block = Block(transactions, now(), 0)
         genesis_block.prev = ""
         return genesis_block
 
+    def add_block(self, block):
+        """
+        Appends a block to the chain and updates the account state
+
+        :param block: The block to append
+        :return: None
+        """
+
+        with self.lock.write():
+            self.chain.append(block)
+            self.apply_block(block)
+            if self.store is not None and self.checkpoint_path and len(self.chain) % CHECKPOINT_INTERVAL == 0:
+                self.save_checkpoint()
+
+    def apply_block(self, block):
+        """
+        Updates the account state, the mempool and the store for a block
+        that is appended to the chain
+
+        :param block: The block
+        :return: None
+        """
+
+        self.ledger.apply_block(block)
+        self.mempool.remove_block(block)
+        for sender in set(tx.sender for tx in block.transactions if tx.nonce is not None):
+            self.mempool.remove_used(sender, self.ledger.next_nonce(sender))
+        if self.store is not None:
+            self.store.append(block)
+
+    def reorganize(self, fork, blocks):
+        """
+        Rolls the chain back to a height and appends new blocks after it.
+        The new chain is built aside and replaces the old one at once, so
+        snapshots never see it rolled back or half applied, and snapshots of
+        the old chain stay valid.
+
+        The rolled back blocks are kept in the block tree, so the chain can
+        switch back to them, and their transactions that the new blocks do
+        not include go back into the mempool.
+
+        :param fork: Amount of blocks to keep
+        :param blocks: Blocks to append after them
+        :return: None
+        """
+
+        with self.lock.write():
+            dropped = self.chain[fork:]
+            orphaned = []
+            for block in dropped:
+                orphaned += block.transactions
+            for block in reversed(dropped):
+                self.ledger.revert_block(block)
+            chain = self.chain.prefix(fork)
+            if self.store is not None:
+                self.store.truncate(fork)
+
+            for block in blocks:
+                self.tree.discard(block.raw_hash)
+                chain.append(block)
+                self.apply_block(block)
+            self.chain = chain
+
+            if self.store is not None and self.checkpoint_path and fork // CHECKPOINT_INTERVAL != len(chain) // CHECKPOINT_INTERVAL:
+                self.save_checkpoint()
+            for block in dropped:
+                self.tree.add(block)
+            self.tree.prune(len(self.chain) - 1)
+
+            included = {tx.hash for block in blocks for tx in block.transactions}
+            self.mempool.reinsert([tx for tx in orphaned if tx.hash not in included], self.ledger.get_balance, self.ledger.next_nonce)
+
+    def load_chain(self, chain):
+        """
+        Replaces the chain with a saved one and rebuilds the account state from it
+
+        :param chain: List of blocks starting at the genesis block
+        :return: None
+        """
+
+        with self.lock.write():
+            self.chain = Chain(blocks=list(chain))
+            self.ledger.rebuild(self.chain)
+
+    def attach_store(self, store, checkpoint_path=None):
+        """
+        Loads the chain saved in a block store and saves new blocks to it.
+        An empty store is filled with the current chain.
+
+        The account state is loaded from the checkpoint if it matches the
+        store, so only the blocks after it are replayed. Blocks stay in the
+        store and are decoded when they are used.
+
+        :param store: BlockStore
+        :param checkpoint_path: Path of the checkpoint file, None to not use checkpoints
+        :return: None
+        """
+
+        with self.lock.write():
+            if len(store) == 0:
+                for block in self.chain:
+                    store.append(block, sync=False)
+                store.sync()
+            else:
+                checkpoint = load_checkpoint(checkpoint_path) if checkpoint_path else None
+                height = 0
+                if checkpoint and 0 < checkpoint['height'] <= len(store) and store[checkpoint['height'] - 1].hash == checkpoint['tip']:
+                    height = checkpoint['height']
+                    self.ledger.set_state(checkpoint['ledger'])
+                    print("[INFO] Loaded checkpoint at block " + str(height - 1))
+                else:
+                    self.ledger = Ledger()
+
+                for i in range(height, len(store)):
+                    self.ledger.apply_block(store[i])
+                self.chain = Chain(store.view())
+
+            self.store = store
+            self.checkpoint_path = checkpoint_path
+
+    def save_checkpoint(self):
+        """
+        Saves the account state at the current tip
+
+        :return: None
+        """
+
+        if not self.checkpoint_path:
+            return
+
+        with self.lock.read():
+            save_checkpoint(self.checkpoint_path, len(self.chain), self.chain[-1].hash, self.ledger)
+
+    def get_block(self, block_hash):
+        """
+        Finds a block of the chain by its hash
+
+        :param block_hash: Hash of the block
+        :return: Block, or None if it is not in the chain
+        """
+
+        try:
+            raw_hash = hash_to_bytes(block_hash)
+        except ValueError:
+            return None
+
+        with self.lock.read():
+            height = self.ledger.block_heights.get(raw_hash)
+            if height is None:
+                return None
+            return self.chain[height]
+
+    def snapshot(self):
+        """
+        Returns the chain as it is now, without copying it or taking the lock
+
+        :return: ChainSnapshot
+        """
+
+        return ChainSnapshot(self.chain)
+
+    def next_target(self, block, parent):
+        """
+        Gets the proof of work target of a new block on the chain
+
+        :param block: The new block
+        :param parent: The block it builds on
+        :return: target (int)
+        """
+
+        with self.lock.read():
+            return self.retarget.expected_target(block, parent, self.chain.__getitem__)
+
     def get_last_block(self):
         """
         Return the latest block on the blockchain
@@ -266,55 +904,84 @@ class Blockchain():
 
         return self.chain[-1]
 
-    def mine_transactions(self, miner):
+    def create_template(self, miner):
         """
-        Creates new blocks including pending transactions with PoW
+        Creates a block to mine on the tip, with the pending transactions
+        paying the most fee per byte after a reward for the miner, which
+        also collects their fees
 
-        :return: None 
+        :param miner: Wallet address the reward goes to
+        :return: Block, not mined yet
         """
 
-        pt_len = len(self.pending_transactions)
-        for i in range(0, pt_len, self.block_size):
-            end = i + self.block_size
-            if i >= pt_len:
-                end = pt_len
-            transactions = self.pending_transactions[i:end]
+        with self.lock.read():
+            tip = self.get_last_block()
+            transactions = self.mempool.take(self.block_size - 1)
+            coinbase = Transaction("Miner Reward", miner, self.miner_reward + sum(tx.fee for tx in transactions))
+            median_time = ChainValidator(self.miner_reward).median_time(tip, self.chain.__getitem__)
 
-            block = Block(
-                transactions,
-                datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
-                len(self.chain)
-                )
+            block = Block([coinbase] + transactions, max(now(), median_time + 1), tip.index + 1)
+            block.prev = tip.hash
+            block.target = self.next_target(block, tip)
+        return block
 
-            block.prev = self.get_last_block().hash
-            block.mine(self.difficulty)
-            self.chain.append(block)
-            print("Mined block %s!" %(block.index))
-            print("Hash: " + block.hash)
+    def submit_block(self, block):
+        """
+        Adds a mined block if it still extends the tip and is valid, and announces it
+
+        :param block: Block from create_template with its proof of work
+        :return: True if the block was added, False if it is stale or not valid
+        """
 
-            for tx in self.pending_transactions[i:end]: #Remove transactions
-                self.pending_transactions.remove(tx)
+        with self.lock.write():
+            tip = self.get_last_block()
+            if tip.raw_hash != block.raw_prev:
+                return False
 
-        self.pending_transactions.append(Transaction("Miner Reward", miner, self.miner_reward))
+            result = ChainValidator(self.miner_reward, self.verifier, self.retarget).validate_blocks(
+                [block], tip, self.ledger.get_balance, block_at=self.chain.__getitem__, nonce_of=self.ledger.next_nonce
+                )
+            if not result:
+                print("[ERROR] Mined block is not valid: " + str(result))
+                if result.transaction is not None and result.transaction.hash in self.mempool:
+                    #So the next template does not fail the same way
+                    self.mempool.evict(result.transaction)
+                return False
 
+            self.add_block(block)
 
-    def add_transaction(self, private_key, sender, reciever, amount):
+        self.gossip.announce_block(block)
+        return True
+
+    def add_transaction(self, private_key, sender, reciever, amount, fee=0):
         """
         Create new transaction object and append it to pending transactions
 
         :param sender: Sender's public key (wallet address)
         :param reciever: Reciever's public key (wallet address)
         :param amount: Amount of PFC to be transfered
-        :return: None
+        :param fee: PFC paid to the miner, higher fees are mined first
+        :return: True if the transaction was added
         """
 
-        transaction = Transaction(sender, reciever, amount)
-        transaction.sign(private_key)
+        with self.lock.write():
+            try:
+                nonce = self.ledger.next_nonce(sender) + self.mempool.pending_count(sender)
+                transaction = Transaction(sender, reciever, amount, fee, nonce)
+            except ValueError as e:
+                print("[ERROR] " + str(e))
+                return False
+            transaction.sign(private_key)
 
-        if not transaction.is_valid(self):
-            print("[ERROR] Transaction is not valid")
-        else:
-            self.pending_transactions.append(transaction)
+            if not transaction.is_valid(self):
+                print("[ERROR] Transaction is not valid")
+                return False
+            elif not self.mempool.add(transaction, self.get_balance(sender), self.ledger.next_nonce(sender)):
+                print("[ERROR] Pending transactions already spend this balance, or the mempool is full")
+                return False
+
+        self.gossip.announce_transactions([transaction])
+        return True
 
     def get_balance(self, wallet):
         """
@@ -324,32 +991,22 @@ class Blockchain():
         :return: balance
         """
 
-        bal = 0
-        for block in self.chain:
-            for transaction in block.transactions:
-                if transaction.reciever == wallet:
-                    bal += int(transaction.amount)
-                if transaction.sender == wallet:
-                    bal -= int(transaction.amount)
-
-        return bal
+        with self.lock.read():
+            return self.ledger.get_balance(wallet)
 
     def transaction_index_from_hash(self, _hash):
         """
         Gets the index of a transaction
 
         :param _hash: The hash of the transaction
-        :return: index of transaction (int)
+        :return: index of transaction (int), or the amount of transactions in the chain if it is not in it
         """
 
-        i = 0
-        for block in self.chain:
-            for tx in block.transactions:
-                if tx.hash == _hash:
-                    return i
-                else:
-                    i += 1
-        return len(self.chain)
+        with self.lock.read():
+            try:
+                return self.ledger.tx_indexes.get(hash_to_bytes(_hash), self.ledger.tx_count)
+            except ValueError:
+                return self.ledger.tx_count
     
     def get_balance_before_transaction(self, wallet, tx_index):
         """
@@ -360,20 +1017,8 @@ class Blockchain():
         :return: balance (int)
         """
 
-        print("I: " + str(tx_index))
-        i = 0
-        bal = 0
-        for block in self.chain:
-            for transaction in block.transactions:
-                if not i >= tx_index:
-                    if transaction.reciever == wallet:
-                        bal += int(transaction.amount)
-                    if transaction.sender == wallet:
-                        bal -= int(transaction.amount)
-                else:
-                    return bal
-                i += 1
-        return bal
+        with self.lock.read():
+            return self.ledger.balance_before(wallet, tx_index)
 
     def get_transaction_history(self, wallet):
         """
@@ -383,17 +1028,70 @@ class Blockchain():
         :return: Transactions (list)
         """
         
-        transactions = []
-        for block in self.chain:
-            for transaction in block.transactions:
-                if transaction.sender == wallet or transaction.reciever == wallet:
-                    transactions.append(transaction)
-        
-        return transactions
+        return [transaction for height, transaction in self.get_address_history(wallet)[2]]
+
+    def get_account(self, wallet):
+        """
+        Gets the balance and next nonce of a wallet together with the block
+        they are valid at
+
+        :param wallet: The wallet address
+        :return: (balance, nonce, tip block)
+        """
+
+        with self.lock.read():
+            return self.ledger.get_balance(wallet), self.ledger.next_nonce(wallet), self.chain[-1]
+
+    def get_address_history(self, wallet, start=0, limit=None):
+        """
+        Gets transactions to or from a wallet with the height of their blocks
+
+        :param wallet: The wallet address
+        :param start: Position of the first transaction in the wallet's history
+        :param limit: Most transactions returned, default all of them
+        :return: (tip block, amount of transactions in the history, list of (height, Transaction))
+        """
+
+        with self.lock.read():
+            chain = self.snapshot()
+            positions = self.ledger.get_positions(wallet)
+            stop = len(positions) if limit is None else start + limit
+            located = [self.ledger.locate(tx_index) for tx_index in positions[start:stop]]
+            total = len(positions)
+        return chain.tip, total, [(height, chain[height].transactions[i]) for height, i in located]
+
+    def get_proof(self, tx_hash):
+        """
+        Gets a Merkle proof that a transaction is in the chain
+
+        :param tx_hash: Hash of the transaction
+        :return: json proof (dict) with the block header, the position of the
+                 transaction in the block and the sibling hashes, or None
+        """
+
+        try:
+            raw_hash = hash_to_bytes(tx_hash)
+        except ValueError:
+            return None
+
+        with self.lock.read():
+            tx_index = self.ledger.tx_indexes.get(raw_hash)
+            if tx_index is None:
+                return None
+            chain = self.snapshot()
+            height, i = self.ledger.locate(tx_index)
+
+        block = chain[height]
+        return {
+            'header': self.header_to_json(BlockHeader.from_block(block)),
+            'index': i,
+            'proof': [sibling.hex() for sibling in block.merkle_tree().proof(i)]
+        }
 
 
 
-    def generate_keys(self):
+    @staticmethod
+    def generate_keys():
         """
         Create public and private RSA keys
         
@@ -415,6 +1113,19 @@ class Blockchain():
 
     #JSON
 
+    def export_json(self, path):
+        """
+        Writes the chain to a json file one block at a time
+
+        :param path: Path of the file
+        :return: None
+        """
+
+        with open(path + ".tmp", "wb") as f:
+            for chunk in json_list(self.snapshot(), lambda block: encode_json(self.block_to_json(block))):
+                f.write(chunk)
+        os.replace(path + ".tmp", path)
+
     def to_json(self):
         """
         Convert blockchain to json
@@ -422,39 +1133,7 @@ class Blockchain():
         :return: json blockchain
         """
 
-        blockchain_json = []
-
-        for block in self.chain:
-            block_json = {
-                'index': block.index,
-                'time': block.time,
-                'prev': block.prev,
-                'nonse': block.nonse,
-                'hash': block.hash,
-                'transactions': []
-            }
-
-            for transaction in block.transactions:
-                #block_json['transactions'].append(
-                    
-                payload = {
-                    'sender': transaction.sender,
-                    'reciever': transaction.reciever,
-                    'amount': transaction.amount,
-                    'time': transaction.time,
-                    'hash': transaction.hash
-                }
-
-                try:
-                    payload['signature'] = transaction.signature
-                except AttributeError:
-                    pass
-
-                block_json['transactions'].append(payload)
-            
-            blockchain_json.append(block_json)
-
-        return blockchain_json
+        return self.blocks_to_json(self.snapshot())
 
     def from_json(self, blockchain_json):
         """
@@ -464,60 +1143,158 @@ class Blockchain():
         :return: blockchain
         """
 
-        blockchain = []
-        for block_json in blockchain_json:
+        return [self.block_from_json(block_json) for block_json in blockchain_json]
 
-            transactions = []
-            for transaction_json in block_json['transactions']:
-                transaction = Transaction(
-                    transaction_json['sender'],
-                    transaction_json['reciever'],
-                    transaction_json['amount']
-                    )
+    def blocks_to_json(self, blocks):
+        """
+        Convert a list of blocks to json
 
-                transaction.time = transaction_json['time']
-                transaction.hash = transaction_json['hash']
+        :param blocks: Blocks
+        :return: json blocks
+        """
 
-                try:
-                    transaction.signature = transaction_json['signature']
-                except:
-                    pass
+        return [self.block_to_json(block) for block in blocks]
 
-                transactions.append(transaction)
-            
-            block = Block(transactions, block_json['time'], block_json['index'])
-            block.hash = block_json['hash']
-            block.prev = block_json['prev']
-            block.nonse = block_json['nonse']
-            blockchain.append(block)
+    def block_to_json(self, block):
+        """
+        Convert a block to json
 
-        return blockchain
+        :param block: Block
+        :return: json block (dict)
+        """
 
-    def pending_transactions_json(self):
+        block_json = {
+            'index': block.index,
+            'version': block.version,
+            'time': block.time,
+            'prev': block.prev,
+            'nonse': block.nonse,
+            'hash': block.hash,
+            'transactions': [self.transaction_to_json(tx) for tx in block.transactions]
+        }
+
+        if block.version >= RETARGET_VERSION:
+            block_json['target'] = target_to_hex(block.target)
+
+        return block_json
+
+    def block_from_json(self, block_json):
         """
-        Converts self.pending_pransactions to json data
+        Convert json to a Block
 
-        :return: Json transactions
+        :param block_json: json block (dict)
+        :return: Block
         """
 
-        transactions = []
-        for transaction in self.pending_transactions:
-            payload = {
-                'sender': transaction.sender,
-                'reciever': transaction.reciever,
-                'amount': transaction.amount,
-                'time': transaction.time,
-                'hash': transaction.hash
-            }
+        transactions = [self.transaction_from_json(tx) for tx in block_json['transactions']]
 
-            try:
-                payload['signature'] = transaction.signature
-            except AttributeError:
-                pass
+        return Block.load(
+            transactions,
+            block_json['time'],
+            block_json['index'],
+            block_json['prev'],
+            block_json['nonse'],
+            block_json['hash'],
+            block_json.get('version', 1),
+            target_from_hex(block_json['target']) if 'target' in block_json else INITIAL_TARGET
+            )
+
+    def header_to_json(self, header):
+        """
+        Convert a block header to json
+
+        :param header: BlockHeader
+        :return: json header (dict)
+        """
+
+        return {
+            'index': header.index,
+            'version': header.version,
+            'time': header.time,
+            'prev': header.prev,
+            'nonse': header.nonse,
+            'hash': header.hash,
+            'root': header.root,
+            'target': target_to_hex(header.target)
+        }
+
+    def header_from_json(self, header_json):
+        """
+        Convert json to a BlockHeader
+
+        :param header_json: json header (dict)
+        :return: BlockHeader
+        """
+
+        return BlockHeader.load(
+            header_json['index'],
+            header_json['time'],
+            header_json['prev'],
+            header_json['nonse'],
+            header_json['hash'],
+            header_json['root'],
+            header_json.get('version', 1),
+            target_from_hex(header_json['target']) if 'target' in header_json else INITIAL_TARGET
+            )
+
+    @staticmethod
+    def transaction_to_json(transaction):
+        """
+        Convert a transaction to json
+
+        :param transaction: Transaction
+        :return: json transaction (dict)
+        """
+
+        payload = {
+            'sender': transaction.sender,
+            'reciever': transaction.reciever,
+            'amount': transaction.amount,
+            'time': transaction.time,
+            'hash': transaction.hash
+        }
 
-            transactions.append(payload)
+        if transaction.fee:
+            payload['fee'] = transaction.fee
 
-        return transactions
+        if transaction.nonce is not None:
+            payload['nonce'] = transaction.nonce
+
+        if transaction.raw_signature is not None:
+            payload['signature'] = transaction.signature
+
+        return payload
+
+    @staticmethod
+    def transaction_from_json(transaction_json):
+        """
+        Convert json to a Transaction
+
+        :param transaction_json: json transaction (dict)
+        :return: Transaction
+        """
+
+        return Transaction.load(
+            transaction_json['sender'],
+            transaction_json['reciever'],
+            transaction_json['amount'],
+            transaction_json['time'],
+            transaction_json['hash'],
+            transaction_json.get('signature'),
+            transaction_json.get('fee', 0),
+            transaction_json.get('nonce')
+            )
+
+    def pending_transactions_json(self):
+        """
+        Converts the mempool to json data
+
+        :return: Json transactions
+        """
+
+        with self.lock.read():
+            transactions = list(self.mempool)
+        return [self.transaction_to_json(tx) for tx in transactions]
 
     def pending_transactions_from_json(self, transactions_json):
         """
@@ -527,40 +1304,78 @@ class Blockchain():
         :return: Transactions
         """
 
-        transactions = []
-        for transaction_json in transactions_json:
-            transaction = Transaction(
-                    transaction_json['sender'],
-                    transaction_json['reciever'],
-                    transaction_json['amount']
-                    )
+        return [self.transaction_from_json(tx) for tx in transactions_json]
 
-            transaction.time = transaction_json['time']
-            transaction.hash = transaction_json['hash']
 
-            try:
-                transaction.signature = transaction_json['signature']
-            except:
-                pass
-
-            transactions.append(transaction)
-
-        return transactions
 
+class Block():
+    """
+    Version 1 blocks hash all transaction hashes, version 2 blocks hash the
+    Merkle root of them instead. Version 3 blocks also hash their own proof
+    of work target.
+    """
 
+    __slots__ = ("index", "timestamp", "transactions", "raw_prev", "nonse", "raw_hash", "version", "tree", "target")
 
-class Block():
-    def __init__(self, transactions, time, index):
+    def __init__(self, transactions, time, index, version=BLOCK_VERSION, target=INITIAL_TARGET):
         self.index = index
         self.time = time
         self.transactions = transactions
+        self.version = version
+        self.target = target
+        self.tree = None
         self.prev = ''
         self.nonse = 0
         self.hash = self.hash_block()
 
+    @classmethod
+    def load(cls, transactions, time, index, prev, nonse, _hash, version=1, target=INITIAL_TARGET):
+        """
+        Creates a block from saved fields without hashing it
+
+        :return: Block
+        """
+
+        block = cls.__new__(cls)
+        block.index = int(index)
+        block.time = time
+        block.transactions = transactions
+        block.version = int(version)
+        block.target = target
+        block.tree = None
+        block.prev = prev
+        block.nonse = int(nonse)
+        block.hash = _hash
+        return block
+
+    @property
+    def time(self):
+        return format_time(self.timestamp)
+
+    @time.setter
+    def time(self, time):
+        self.timestamp = parse_time(time)
+
+    @property
+    def prev(self):
+        return self.raw_prev.hex()
+
+    @prev.setter
+    def prev(self, prev):
+        self.raw_prev = hash_to_bytes(prev)
+
+    @property
+    def hash(self):
+        return self.raw_hash.hex()
+
+    @hash.setter
+    def hash(self, _hash):
+        self.raw_hash = hash_to_bytes(_hash)
+
     def __str__(self):
         return_str = f"""
 Index: {self.index}
+Version: {self.version}
 Time: {self.time}
 Hash: {self.hash}
 Previous Hash: {self.prev}
@@ -572,43 +1387,116 @@ Transactions:\n"""
 
         return return_str
 
-    def block_str(self):
+    def tx_commitment(self):
+        """
+        :return: The part of the hashed string standing for the transactions
+        """
+
+        if self.version >= 2:
+            return self.tx_root().hex()
+
         transaction_hashes = ''
         for transaction in self.transactions:
             transaction_hashes += transaction.hash
+        return transaction_hashes
 
-        return self.time + transaction_hashes + self.prev + str(self.nonse)
+    def header_str(self):
+        """
+        :return: The hashed string without the nonse
+        """
 
-    def hash_block(self):
+        if self.version >= RETARGET_VERSION:
+            return self.time + self.tx_commitment() + self.prev + target_to_hex(self.target)
+        return self.time + self.tx_commitment() + self.prev
+
+    def block_str(self):
+        return self.header_str() + str(self.nonse)
+
+    def header_prefix(self):
         """
-        Hash data in block
+        Encoded block data hashed before the nonse
+
+        json.dumps escapes each character on its own, so the json string
+        hashed by hash_block is this prefix, the nonse digits and a closing quote.
 
+        :return: bytes
+        """
+
+        return json.dumps(self.header_str())[:-1].encode()
+
+    def header_midstate(self):
+        """
+        SHA-256 state after hashing header_prefix
+
+        Copy it and feed in b'%d"' % nonse to get the same digest as hash_block
+        without rehashing the transactions for every nonse.
+
+        :return: hashlib sha256 object
+        """
+
+        return hashlib.sha256(self.header_prefix())
+
+    def hash_nonse(self, midstate, nonse):
+        """
+        Hash the block with another nonse, starting from header_midstate
+
+        :param midstate: Result of header_midstate
+        :param nonse: The nonse to hash
         :return: Hash
         """
 
-        transaction_hashes = ''
-        for transaction in self.transactions:
-            transaction_hashes += transaction.hash
+        header = midstate.copy()
+        header.update(b'%d"' % nonse)
+        return header.hexdigest()
 
-        block_str = self.time + transaction_hashes + self.prev + str(self.nonse)
+    def hash_block(self):
+        """
+        Hash data in block
+
+        :return: Hash
+        """
 
         encoded_block = hashlib.sha256(
-            json.dumps(block_str, sort_keys=True).encode()
+            json.dumps(self.block_str(), sort_keys=True).encode()
             ).hexdigest()
 
         return encoded_block
 
-    def mine(self, difficulty):
+    def merkle_tree(self):
+        """
+        Builds the Merkle tree of the transactions once and keeps it
+
+        :return: MerkleTree
+        """
+
+        if self.tree is None:
+            self.tree = MerkleTree([transaction.raw_hash for transaction in self.transactions])
+        return self.tree
+
+    def tx_root(self):
+        """
+        :return: Raw Merkle root of the transaction hashes
         """
-        Create proof of work for block
 
-        :param difficulty: ammount of 0's needed in hash
+        return self.merkle_tree().root
+
+    def mine(self):
+        """
+        Create proof of work for block, a hash at most its target
+
         :return: None
         """
 
-        while self.hash[0:difficulty] != '0' * difficulty:
-            self.nonse += 1
-            self.hash = self.hash_block()
+        midstate = self.header_midstate()
+        target = self.target.to_bytes(32, "big")
+
+        found = None
+        while found is None:
+            found, tried = search(midstate, target, self.nonse, 1, 100000)
+            self.nonse += tried
+
+        self.nonse = found
+        self.hash = self.hash_block()
 
     def valid_transactions(self, chain):
         i = 0
@@ -620,15 +1508,182 @@ Transactions:\n"""
                 return False
         return True
 
+class BlockHeader():
+    """
+    The fields of a block without its transactions, with the Merkle root
+    of their hashes instead.
+    """
+
+    __slots__ = ("index", "timestamp", "raw_prev", "nonse", "raw_hash", "raw_root", "version", "target")
+
+    @classmethod
+    def from_block(cls, block):
+        header = cls.__new__(cls)
+        header.index = block.index
+        header.version = block.version
+        header.target = block.target
+        header.timestamp = block.timestamp
+        header.raw_prev = block.raw_prev
+        header.nonse = block.nonse
+        header.raw_hash = block.raw_hash
+        header.raw_root = block.tx_root()
+        return header
+
+    @classmethod
+    def load(cls, index, time, prev, nonse, _hash, root, version=1, target=INITIAL_TARGET):
+        header = cls.__new__(cls)
+        header.index = int(index)
+        header.version = int(version)
+        header.target = target
+        header.timestamp = parse_time(time)
+        header.raw_prev = hash_to_bytes(prev)
+        header.nonse = int(nonse)
+        header.raw_hash = hash_to_bytes(_hash)
+        header.raw_root = hash_to_bytes(root)
+        return header
+
+    @property
+    def time(self):
+        return format_time(self.timestamp)
+
+    @property
+    def prev(self):
+        return self.raw_prev.hex()
+
+    @property
+    def hash(self):
+        return self.raw_hash.hex()
+
+    @property
+    def root(self):
+        return self.raw_root.hex()
+
+    def hash_header(self):
+        """
+        Hash the header the same way as Block.hash_block. Only headers from
+        version 2 on hold everything their hash covers.
+
+        :return: Hash
+        """
+
+        block_str = self.time + self.root + self.prev
+        if self.version >= RETARGET_VERSION:
+            block_str += target_to_hex(self.target)
+        block_str += str(self.nonse)
+        return hashlib.sha256(json.dumps(block_str, sort_keys=True).encode()).hexdigest()
+
+
 class Transaction():
-    def __init__(self, sender, reciever, amount):
+    """
+    A transfer of PFC. The sender can pay an optional fee on top of the
+    amount, which the miner of the block may add to its reward.
+
+    Transfers carry a nonce, counting the transactions of their sender
+    from 0. It is part of the hash, so two otherwise equal transfers in the
+    same second differ, and the chain only accepts the sender's next nonce,
+    so a transaction cannot be replayed. Transactions from before nonces
+    and miner rewards have none.
+    """
+
+    __slots__ = ("raw_sender", "raw_reciever", "amount", "fee", "nonce", "timestamp", "raw_hash", "raw_signature")
+
+    def __init__(self, sender, reciever, amount, fee=0, nonce=None):
         self.sender = sender
         self.reciever = reciever
-        self.amount = amount
-        self.time = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+        self.amount = int(amount)
+        self.fee = int(fee)
+        if self.amount <= 0:
+            raise ValueError("amount must be positive: " + str(amount))
+        if self.fee < 0:
+            raise ValueError("fee is negative: " + str(fee))
+        self.nonce = int(nonce) if nonce is not None else None
+        self.timestamp = now()
+        self.raw_signature = None
         self.hash = self.hash_transaction()
 
+    @classmethod
+    def load(cls, sender, reciever, amount, time, _hash, signature=None, fee=0, nonce=None):
+        """
+        Creates a transaction from saved fields without hashing it
+
+        :return: Transaction
+        """
+
+        transaction = cls.__new__(cls)
+        transaction.sender = sender
+        transaction.reciever = reciever
+        transaction.amount = int(amount)
+        transaction.fee = int(fee)
+        transaction.nonce = int(nonce) if nonce is not None else None
+        transaction.time = time
+        transaction.hash = _hash
+        transaction.raw_signature = None
+        if signature is not None:
+            transaction.signature = signature
+        return transaction
+
+    @property
+    def sender(self):
+        return address_from_bytes(self.raw_sender)
+
+    @sender.setter
+    def sender(self, sender):
+        self.raw_sender = address_to_bytes(sender)
+
+    @property
+    def reciever(self):
+        return self.raw_reciever.hex()
+
+    @reciever.setter
+    def reciever(self, reciever):
+        if reciever == MINER_REWARD:
+            raise ValueError("invalid wallet address: " + reciever)
+        self.raw_reciever = address_to_bytes(reciever)
+
+    @property
+    def time(self):
+        return format_time(self.timestamp)
+
+    @time.setter
+    def time(self, time):
+        self.timestamp = parse_time(time)
+
+    @property
+    def hash(self):
+        return self.raw_hash.hex()
+
+    @hash.setter
+    def hash(self, _hash):
+        self.raw_hash = hash_to_bytes(_hash)
+
+    @property
+    def signature(self):
+        if self.raw_signature is None:
+            raise AttributeError("transaction is not signed")
+        return self.raw_signature.hex()
+
+    @signature.setter
+    def signature(self, signature):
+        self.raw_signature = signature_to_bytes(signature)
+
+    @property
+    def cost(self):
+        """
+        :return: What the transaction takes from the sender's balance
+        """
+
+        return self.amount + self.fee
+
+    def size(self):
+        """
+        :return: Size of the transaction's json in bytes, used for its fee per byte
+        """
+
+        return len(encode_json(Blockchain.transaction_to_json(self)))
+
     def __str__(self):
+        if self.fee:
+            return f"{self.sender} --> {self.reciever}  {self.amount}PFC (fee {self.fee}PFC)"
         return f"{self.sender} --> {self.reciever}  {self.amount}PFC"
 
     def hash_transaction(self):
@@ -639,6 +1694,10 @@ class Transaction():
         """
 
         transaction_str = str(self.sender) + str(self.reciever) + str(self.amount) + self.time
+        if self.fee:
+            transaction_str += str(self.fee) #Times have a fixed length, so this cannot look like another transaction
+        if self.nonce is not None:
+            transaction_str += "n" + str(self.nonce)
 
         encded_transaction = hashlib.sha256(
             json.dumps(
@@ -654,38 +1713,83 @@ class Transaction():
         :return: True of False
         """
 
-        if self.sender == 'Miner Reward':
-            if self.amount > chain.miner_reward:
-                print("reward too high")
-                return False
+        tx_index = chain.transaction_index_from_hash(self.hash)
+        balance = chain.get_balance_before_transaction(self.sender, tx_index)
+
+        reason = self.check(balance, chain.miner_reward, chain.verifier)
+        if reason:
+            print(reason)
+            return False
+        return True
+
+    def check(self, balance, miner_reward, verifier=None):
+        """
+        Check transaction against the balance its sender has before it
+
+        :param balance: Balance of the sender before the transaction
+        :param miner_reward: Highest allowed miner reward
+        :param verifier: SignatureVerifier caching verified transactions, optional
+        :return: Reason why the transaction is invalid, or None if it is valid
+        """
+
+        amount = self.amount
+
+        if amount <= 0:
+            return "amount is not positive"
+
+        if self.fee < 0:
+            return "fee is negative"
+
+        if self.nonce is not None and self.nonce < 0:
+            return "nonce is negative"
+
+        if self.raw_sender is None:
+            if amount > miner_reward:
+                return "reward too high"
+            if self.fee:
+                return "rewards do not pay fees"
+            if self.nonce is not None:
+                return "rewards do not have nonces"
             
         else:
-            try:
-                tx_index = chain.transaction_index_from_hash(self.hash)
-                if int(self.amount) > chain.get_balance_before_transaction(self.sender, tx_index):
-                    print("sender does not have enough balance")
-                    return False
+            if amount + self.fee > balance:
+                return "sender does not have enough balance"
+
+            if verifier is None:
+                reason = self.verify_signature()
+                if reason:
+                    return reason
+            elif self.raw_signature is None:
+                return "no signature"
+            elif not verifier.verify(self):
+                return "bad signiture"
 
+        if self.hash != self.hash_transaction():
+            return "invalid hash"
+
+        return None
 
-                verify_key = nacl.signing.VerifyKey(self.sender, encoder=nacl.encoding.HexEncoder)
+    def verify_signature(self):
+        """
+        Check the signature of the transaction on its own
 
-                signature_bytes = nacl.encoding.HexEncoder.decode(self.signature)
+        :return: Reason why the signature is invalid, or None if it is valid
+        """
 
-                try:
-                    verify_key.verify(bytes(self.hash, "ASCII"), signature_bytes)
-                except nacl.exceptions.BadSignatureError:
-                    print("bad signiture")
-                    return False
+        try:
+            verify_key = nacl.signing.VerifyKey(self.sender, encoder=nacl.encoding.HexEncoder)
+            signature_bytes = nacl.encoding.HexEncoder.decode(self.signature)
+        except AttributeError:
+            return "no signature"
+        except (TypeError, ValueError):
+            return "invalid sender or signature"
 
-            except AttributeError:
-                print("no signature")
-                return False
+        try:
+            verify_key.verify(bytes(self.hash, "ASCII"), signature_bytes)
+        except nacl.exceptions.BadSignatureError:
+            return "bad signiture"
 
-        if self.hash != self.hash_transaction():
-            print("invalid hash")
-            return False
-        else:
-            return True
+        return None
 
     def sign(self, private_key):
         """
@@ -695,5 +1799,4 @@ class Transaction():
         """
 
         signing_key = nacl.signing.SigningKey(private_key, encoder=nacl.encoding.HexEncoder)
-        signature = signing_key.sign(bytes(self.hash, 'ASCII')).signature
-        self.signature = nacl.encoding.HexEncoder.encode(signature).decode("ASCII")
+        self.raw_signature = signing_key.sign(bytes(self.hash, 'ASCII')).signature
@@ -0,0 +1,301 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import weakref
+from array import array
+from collections import OrderedDict
+
+from puffincoin.streaming import CHUNK_SIZE, parse_json_list
+
+LENGTH = struct.Struct(">I")
+OFFSET = struct.Struct(">Q")
+
+
+class BlockStore():
+    """
+    Append-only block log.
+
+    Every block is stored as a 4 byte length followed by its json. The
+    offset of each record is kept in a separate index file, both files are
+    fsynced on append and a reorg truncates them to the fork point. Blocks
+    are read from a memory map of the log and decoded when accessed.
+    """
+
+    def __init__(self, path, to_json, from_json):
+        """
+        :param path: Path of the block log, the index is stored at path + ".idx"
+        :param to_json: Function converting a Block to a json dict
+        :param from_json: Function converting a json dict to a Block
+        """
+
+        self.path = path
+        self.index_path = path + ".idx"
+        self.to_json = to_json
+        self.from_json = from_json
+
+        self.log = open(path, "a+b")
+        self.index = open(self.index_path, "a+b")
+        self.map = None
+
+        self.offsets = array("Q")
+        self.size = 0 #Position in the log after the last record
+        self.lock = threading.RLock()
+        self.views = weakref.WeakSet() #StoredBlocks reading from this store
+        self.load_index()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("block index out of range")
+
+        return self.from_json(json.loads(self.read(i)))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def load_index(self):
+        """
+        Reads the offset index, rebuilding it from the log if a crash left
+        the files out of step
+
+        :return: None
+        """
+
+        size = os.path.getsize(self.path)
+        self.index.seek(0)
+        data = self.index.read()
+
+        if len(data) % OFFSET.size == 0:
+            self.offsets = array("Q", (offset for offset, in OFFSET.iter_unpack(data)))
+            self.size = 0
+            if self.offsets and self.offsets[-1] + LENGTH.size <= size:
+                self.log.seek(self.offsets[-1])
+                length, = LENGTH.unpack(self.log.read(LENGTH.size))
+                self.size = self.offsets[-1] + LENGTH.size + length
+
+            if self.size == size:
+                return
+
+        #Rebuild index by walking the length prefixes
+        self.offsets = array("Q")
+        self.log.seek(0)
+        position = 0
+        while position + LENGTH.size <= size:
+            self.log.seek(position)
+            length, = LENGTH.unpack(self.log.read(LENGTH.size))
+            if position + LENGTH.size + length > size: #Partial record
+                break
+            self.offsets.append(position)
+            position += LENGTH.size + length
+
+        self.size = position
+        self.log.truncate(position)
+        self.index.truncate(0)
+        self.index.write(b"".join(OFFSET.pack(offset) for offset in self.offsets))
+        self.sync()
+
+    def read(self, i):
+        """
+        Reads the json of a block from the memory mapped log
+
+        :param i: Height of the block
+        :return: bytes
+        """
+
+        with self.lock:
+            offset = self.offsets[i]
+            if self.map is None or self.map.size() < offset + LENGTH.size:
+                self.remap()
+
+            length, = LENGTH.unpack_from(self.map, offset)
+            start = offset + LENGTH.size
+            if self.map.size() < start + length:
+                self.remap()
+
+            return self.map[start:start + length]
+
+    def remap(self):
+        if self.map is not None:
+            self.map.close()
+        self.log.flush()
+        self.map = mmap.mmap(self.log.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def sync(self):
+        self.log.flush()
+        self.index.flush()
+        os.fsync(self.log.fileno())
+        os.fsync(self.index.fileno())
+
+    def append(self, block, sync=True):
+        """
+        Appends a block to the log
+
+        :param block: The block
+        :param sync: fsync the files after writing
+        :return: None
+        """
+
+        self.append_json(self.to_json(block), sync)
+
+    def append_json(self, block_json, sync=True):
+        data = json.dumps(block_json, separators=(",", ":")).encode()
+        with self.lock:
+            self.log.write(LENGTH.pack(len(data)) + data)
+            self.index.write(OFFSET.pack(self.size))
+            self.offsets.append(self.size)
+            self.size += LENGTH.size + len(data)
+
+            if sync:
+                self.sync()
+
+    def truncate(self, height):
+        """
+        Removes all blocks from a height onwards
+
+        :param height: Amount of blocks to keep
+        :return: None
+        """
+
+        with self.lock:
+            if height >= len(self):
+                return
+
+            #Views still reading the removed blocks keep their own copies
+            for view in list(self.views):
+                view.detach(height)
+
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+
+            self.size = self.offsets[height]
+            self.log.truncate(self.size)
+            self.index.truncate(height * OFFSET.size)
+            del self.offsets[height:]
+            self.sync()
+
+    def view(self, height=None):
+        """
+        :param height: Amount of blocks in the view, default all of them
+        :return: StoredBlocks reading the first blocks of this store
+        """
+
+        view = StoredBlocks(self, len(self) if height is None else height)
+        self.views.add(view)
+        return view
+
+    def import_json(self, path, validate=None):
+        """
+        Appends the blocks of a blockchain.json file. Every block is decoded
+        before it is stored, so a block that could not be loaded later is
+        found here. On an error the blocks appended so far stay in the store.
+
+        :param path: Path to the json file
+        :param validate: Function checking the whole imported chain, returning a ValidationResult
+        :return: Amount of imported blocks
+        """
+
+        imported = 0
+        with open(path, "rb") as f:
+            for block_json in parse_json_list(iter(lambda: f.read(CHUNK_SIZE), b"")):
+                self.from_json(block_json)
+                self.append_json(block_json, sync=False)
+                imported += 1
+        self.sync()
+
+        if validate is not None:
+            result = validate(self)
+            if not result:
+                raise ValueError("chain is not valid: " + str(result))
+
+        return imported
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.log.close()
+        self.index.close()
+
+
+class StoredBlocks():
+    """
+    The first blocks of a BlockStore, decoded when they are accessed.
+
+    Recently used blocks are cached. If the store is truncated below the end
+    of the view, the blocks it loses are decoded first and kept by the view,
+    so the view never changes.
+    """
+
+    def __init__(self, store, height, cache_size=2048):
+        """
+        :param store: The BlockStore
+        :param height: Amount of blocks in the view
+        :param cache_size: Amount of decoded blocks to keep
+        """
+
+        self.store = store
+        self.height = height
+        self.cache_size = cache_size
+        self.cache = OrderedDict() # height -> Block
+        self.detached = {} # height -> Block removed from the store
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.height:
+            raise IndexError("block index out of range")
+
+        with self.lock:
+            block = self.cache.get(i)
+            if block is not None:
+                self.cache.move_to_end(i)
+                return block
+
+        with self.store.lock: #A truncate cannot run between the two lookups
+            block = self.detached.get(i)
+            if block is not None:
+                return block
+            data = self.store.read(i)
+
+        block = self.store.from_json(json.loads(data))
+        with self.lock:
+            self.cache[i] = block
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return block
+
+    def read_json(self, i):
+        """
+        :param i: Height of the block
+        :return: json bytes of the block as stored, or None if it is no longer in the store
+        """
+
+        with self.store.lock:
+            if i in self.detached:
+                return None
+            return self.store.read(i)
+
+    def detach(self, height):
+        """
+        Keeps the blocks of the view from a height onwards in memory
+
+        :param height: Height the store is about to be truncated to
+        :return: None
+        """
+
+        for i in range(height, self.height):
+            if i not in self.detached:
+                self.detached[i] = self[i]
@@ -0,0 +1,130 @@
+class BlockTree():
+    """
+    Blocks that are not part of the main chain.
+
+    Side blocks belong to competing branches that fork off the main chain,
+    directly or through other side blocks. They are kept so the chain can
+    switch to their branch once it has more work, and blocks dropped from
+    the main chain by a reorg become side blocks themselves.
+
+    Orphans are blocks whose parent has not arrived yet. They wait until it
+    does and are then connected like any other block.
+
+    Both are keyed by raw block hash and are bounded: side blocks deeper
+    than max_depth below the tip are pruned, and the oldest orphans give way
+    to new ones.
+    """
+
+    def __init__(self, max_depth=100, max_orphans=100):
+        """
+        :param max_depth: Most blocks below the tip a branch can fork off and still be kept
+        :param max_orphans: Most orphans kept
+        """
+
+        self.max_depth = max_depth
+        self.max_orphans = max_orphans
+        self.blocks = {} # raw hash -> side Block
+        self.orphans = {} # raw hash -> orphan Block, oldest first
+        self.waiting = {} # raw parent hash -> raw hashes of the orphans building on it
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __contains__(self, raw_hash):
+        return raw_hash in self.blocks or raw_hash in self.orphans
+
+    def get(self, raw_hash):
+        return self.blocks.get(raw_hash)
+
+    def is_orphan(self, raw_hash):
+        return raw_hash in self.orphans
+
+    def add(self, block):
+        self.blocks[block.raw_hash] = block
+
+    def discard(self, raw_hash):
+        self.blocks.pop(raw_hash, None)
+
+    def add_orphan(self, block):
+        """
+        Keeps a block until its parent arrives
+
+        :param block: The block
+        :return: None
+        """
+
+        if block.raw_hash in self.orphans:
+            return
+
+        while len(self.orphans) >= self.max_orphans:
+            self.remove_orphan(next(iter(self.orphans)))
+
+        self.orphans[block.raw_hash] = block
+        self.waiting.setdefault(block.raw_prev, []).append(block.raw_hash)
+
+    def remove_orphan(self, raw_hash):
+        block = self.orphans.pop(raw_hash)
+        children = self.waiting[block.raw_prev]
+        children.remove(raw_hash)
+        if not children:
+            del self.waiting[block.raw_prev]
+
+    def take_orphans(self, raw_hash):
+        """
+        Removes the orphans building on a block that just arrived
+
+        :param raw_hash: Raw hash of the block
+        :return: List of the orphan blocks
+        """
+
+        children = self.waiting.pop(raw_hash, [])
+        return [self.orphans.pop(child) for child in children]
+
+    def branch(self, raw_hash):
+        """
+        Follows side blocks back to where they fork off the main chain
+
+        :param raw_hash: Raw hash of a side block
+        :return: The side blocks from the first after the fork up to this one
+        """
+
+        branch = []
+        block = self.blocks.get(raw_hash)
+        while block is not None:
+            branch.append(block)
+            block = self.blocks.get(block.raw_prev)
+
+        branch.reverse()
+        return branch
+
+    def remove_descendants(self, raw_hash):
+        """
+        Removes a side block and every side block building on it
+
+        :param raw_hash: Raw hash of the block
+        :return: None
+        """
+
+        doomed = [raw_hash]
+        children = {}
+        for block in self.blocks.values():
+            children.setdefault(block.raw_prev, []).append(block.raw_hash)
+
+        while doomed:
+            raw_hash = doomed.pop()
+            self.blocks.pop(raw_hash, None)
+            doomed += children.get(raw_hash, [])
+
+    def prune(self, height):
+        """
+        Drops side blocks and orphans too far below the tip to matter
+
+        :param height: Height of the tip
+        :return: None
+        """
+
+        lowest = height - self.max_depth
+        for raw_hash in [raw_hash for raw_hash, block in self.blocks.items() if block.index <= lowest]:
+            del self.blocks[raw_hash]
+        for raw_hash in [raw_hash for raw_hash, block in self.orphans.items() if block.index <= lowest]:
+            self.remove_orphan(raw_hash)
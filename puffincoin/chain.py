@@ -0,0 +1,70 @@
+class Chain():
+    """
+    List of blocks whose older part can stay in the block store.
+
+    The first blocks come from a StoredBlocks view and are only decoded when
+    they are used, the blocks after them are kept in memory. Blocks are only
+    ever appended; cutting the chain with prefix returns a new Chain, so a
+    ChainSnapshot of this one stays valid.
+    """
+
+    def __init__(self, stored=None, blocks=None):
+        """
+        :param stored: StoredBlocks holding the first blocks, optional
+        :param blocks: List of the blocks after them
+        """
+
+        self.stored = stored
+        self.base = len(stored) if stored is not None else 0
+        self.blocks = blocks if blocks is not None else []
+
+    def __len__(self):
+        return self.base + len(self.blocks)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1 and start >= self.base:
+                return self.blocks[start - self.base:stop - self.base]
+            return [self[i] for i in range(start, stop, step)]
+
+        if index < 0:
+            index += len(self)
+        if index < 0:
+            raise IndexError("block index out of range")
+        if index < self.base:
+            return self.stored[index]
+        return self.blocks[index - self.base]
+
+    def __iter__(self):
+        for i in range(self.base):
+            yield self.stored[i]
+        yield from self.blocks[:]
+
+    def block_json(self, index, encode):
+        """
+        Gets the json of a block, read straight from the store for stored blocks
+
+        :param index: Height of the block
+        :param encode: Function converting a Block to json bytes
+        :return: bytes
+        """
+
+        if index < self.base:
+            data = self.stored.read_json(index)
+            if data is not None:
+                return data
+        return encode(self[index])
+
+    def append(self, block):
+        self.blocks.append(block)
+
+    def prefix(self, height):
+        """
+        :param height: Amount of blocks to keep
+        :return: New Chain with the first blocks of this one
+        """
+
+        if height >= self.base:
+            return Chain(self.stored, self.blocks[:height - self.base])
+        return Chain(self.stored.store.view(height), [])
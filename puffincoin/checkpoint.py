@@ -0,0 +1,49 @@
+import os
+import pickle
+
+CHECKPOINT_INTERVAL = 1000 #Blocks between checkpoints
+FORMAT = 2 #Checkpoints of an older format are ignored and the state is replayed
+
+
+def save_checkpoint(path, height, tip_hash, ledger):
+    """
+    Saves the account state at a height, replacing the previous checkpoint
+
+    :param path: Path of the checkpoint file
+    :param height: Amount of blocks the state covers
+    :param tip_hash: Hash of the last of those blocks
+    :param ledger: Ledger of exactly those blocks
+    :return: None
+    """
+
+    checkpoint = {
+        'format': FORMAT,
+        'height': height,
+        'tip': tip_hash,
+        'ledger': ledger.get_state()
+    }
+
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def load_checkpoint(path):
+    """
+    Reads a checkpoint written by save_checkpoint
+
+    :param path: Path of the checkpoint file
+    :return: Dict with height, tip and ledger, or None if there is no usable checkpoint
+    """
+
+    try:
+        with open(path, "rb") as f:
+            checkpoint = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        return None
+
+    if not isinstance(checkpoint, dict) or checkpoint.get('format') != FORMAT:
+        return None
+    return checkpoint
@@ -0,0 +1,107 @@
+MAX_TARGET = 2 ** 256 - 1 #Any hash is valid
+INITIAL_TARGET = 16 ** 58 - 1 #6 leading hex zeros, the fixed difficulty before retargeting
+RETARGET_INTERVAL = 100 #Blocks between target adjustments
+TARGET_SPACING = 60 #Seconds between blocks the target aims for
+MAX_ADJUSTMENT = 4 #Most the target changes by in one adjustment, in either direction
+RETARGET_VERSION = 3 #First block version with its own target
+
+
+def hash_value(raw_hash):
+    """
+    :param raw_hash: Raw 32 byte block hash
+    :return: The hash as an integer, compared against targets
+    """
+
+    return int.from_bytes(raw_hash, "big")
+
+
+def block_work(target):
+    """
+    :param target: Target of a block
+    :return: Expected amount of hashes needed to find a block with the target
+    """
+
+    return (MAX_TARGET + 1) // (target + 1)
+
+
+def chain_work(blocks):
+    """
+    :param blocks: Blocks or BlockHeaders
+    :return: Total work of the blocks, used to pick the chain with the most work
+    """
+
+    return sum(block_work(block.target) for block in blocks)
+
+
+def target_to_hex(target):
+    return "%064x" % target
+
+
+def target_from_hex(target_hex):
+    target = int(target_hex, 16)
+    if not 0 < target <= MAX_TARGET:
+        raise ValueError("invalid target: " + str(target_hex))
+    return target
+
+
+class Retarget():
+    """
+    Rules for the proof of work target of each block.
+
+    Blocks before version 3 all use the initial target. From version 3 on
+    the target is kept from the parent, except every interval blocks, where
+    it is scaled by how long the last interval blocks actually took
+    compared to spacing seconds each. A hash is valid if it is at most the
+    target, so a smaller target means more work.
+    """
+
+    def __init__(self, interval=RETARGET_INTERVAL, spacing=TARGET_SPACING, initial_target=INITIAL_TARGET, max_target=MAX_TARGET):
+        """
+        :param interval: Blocks between adjustments
+        :param spacing: Seconds between blocks aimed for
+        :param initial_target: Target of the first blocks
+        :param max_target: Easiest target allowed
+        """
+
+        self.interval = interval
+        self.spacing = spacing
+        self.initial_target = initial_target
+        self.max_target = max_target
+
+    def adjust(self, target, first_time, last_time):
+        """
+        Scales a target by the time its last interval took
+
+        :param target: Target of the blocks in the interval
+        :param first_time: Timestamp of the first block in the interval
+        :param last_time: Timestamp of the last block in the interval
+        :return: New target
+        """
+
+        expected = (self.interval - 1) * self.spacing
+        span = min(max(last_time - first_time, expected // MAX_ADJUSTMENT), expected * MAX_ADJUSTMENT)
+        return max(min(target * span // expected, self.max_target), 1)
+
+    def expected_target(self, block, parent, block_at):
+        """
+        Gets the target a block has to carry
+
+        :param block: Block or BlockHeader being checked
+        :param parent: Block or BlockHeader it builds on
+        :param block_at: Function returning the block at an earlier height
+        :return: target (int)
+        """
+
+        if block.version < RETARGET_VERSION or parent.index == 0:
+            return self.initial_target
+        if parent.version < RETARGET_VERSION:
+            return parent.target
+
+        height = block.index
+        if height % self.interval or height <= self.interval:
+            return parent.target
+
+        first = block_at(height - self.interval)
+        if first.version < RETARGET_VERSION:
+            return parent.target #Only intervals mined with retargeting are measured
+        return self.adjust(parent.target, first.timestamp, parent.timestamp)
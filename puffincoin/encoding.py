@@ -0,0 +1,99 @@
+import time
+from datetime import date
+
+EPOCH = date(1970, 1, 1).toordinal()
+MINER_REWARD = 'Miner Reward'
+
+_addresses = {} # Interned address bytes, so every tx of a wallet shares one object
+
+
+def now():
+    """
+    Current time as seconds since 01-01-1970 00:00:00 UTC
+
+    Block and transaction times are time strings without a timezone. Older
+    blocks hold local wall clock time, new ones hold UTC so that every node
+    measures block times the same way.
+
+    :return: timestamp (int)
+    """
+
+    return int(time.time())
+
+
+def parse_time(time_str):
+    """
+    Converts a "%d-%m-%Y %H:%M:%S" time to a timestamp
+
+    :param time_str: Time string
+    :return: timestamp (int)
+    """
+
+    if isinstance(time_str, int):
+        return time_str
+
+    day, month, year = int(time_str[0:2]), int(time_str[3:5]), int(time_str[6:10])
+    hour, minute, second = int(time_str[11:13]), int(time_str[14:16]), int(time_str[17:19])
+    timestamp = (date(year, month, day).toordinal() - EPOCH) * 86400 + hour * 3600 + minute * 60 + second
+
+    if format_time(timestamp) != time_str: #Hashes are made from the string, it has to round trip
+        raise ValueError("invalid time: " + time_str)
+
+    return timestamp
+
+
+def format_time(timestamp):
+    """
+    Converts a timestamp to a "%d-%m-%Y %H:%M:%S" time
+
+    :param timestamp: timestamp (int)
+    :return: Time string
+    """
+
+    days, seconds = divmod(timestamp, 86400)
+    day = date.fromordinal(EPOCH + days)
+    return "%02d-%02d-%04d %02d:%02d:%02d" % (
+        day.day, day.month, day.year, seconds // 3600, seconds // 60 % 60, seconds % 60
+        )
+
+
+def hash_to_bytes(hash_str):
+    """
+    :param hash_str: 64 character hex hash, or "" for no hash
+    :return: 32 bytes (b"" for no hash)
+    """
+
+    if hash_str == "":
+        return b""
+    if len(hash_str) != 64:
+        raise ValueError("invalid hash: " + str(hash_str))
+    return bytes.fromhex(hash_str)
+
+
+def address_to_bytes(address):
+    """
+    :param address: Hex public key, or "Miner Reward"
+    :return: 32 bytes, or None for miner rewards
+    """
+
+    if address == MINER_REWARD:
+        return None
+    if not isinstance(address, str) or len(address) != 64:
+        raise ValueError("invalid wallet address: " + str(address))
+
+    raw = bytes.fromhex(address)
+    if len(_addresses) > 1000000:
+        _addresses.clear()
+    return _addresses.setdefault(raw, raw)
+
+
+def address_from_bytes(raw):
+    if raw is None:
+        return MINER_REWARD
+    return raw.hex()
+
+
+def signature_to_bytes(signature):
+    if not isinstance(signature, str) or len(signature) != 128:
+        raise ValueError("invalid signature")
+    return bytes.fromhex(signature)
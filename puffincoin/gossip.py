@@ -0,0 +1,170 @@
+import asyncio
+import json
+import random
+import threading
+from collections import OrderedDict
+
+
+class Gossip():
+    """
+    Pushes new blocks and transactions through the network.
+
+    A node that mines a block or accepts a transaction sends its hash to a
+    few peers in an /inv message. Peers that do not have it yet download it
+    from the sender, check it and announce it further. Hashes that were
+    already seen are ignored, so every item crosses each link at most once.
+    """
+
+    def __init__(self, blockchain, fanout=8, seen_size=100000):
+        """
+        :param blockchain: The blockchain of this node
+        :param fanout: Most peers an item is announced to
+        :param seen_size: Amount of block and transaction hashes to remember
+        """
+
+        self.blockchain = blockchain
+        self.client = blockchain.client
+        self.fanout = fanout
+        self.seen_size = seen_size
+        self.seen = OrderedDict() # hash -> True, for blocks and transactions
+        self.lock = threading.Lock() #Invs arrive on the node's threads, downloads finish on the client's loop
+
+    def mark_seen(self, item_hash):
+        """
+        :param item_hash: Hash of a block or transaction
+        :return: True if the hash was not seen before
+        """
+
+        with self.lock:
+            if item_hash in self.seen:
+                self.seen.move_to_end(item_hash)
+                return False
+
+            self.seen[item_hash] = True
+            if len(self.seen) > self.seen_size:
+                self.seen.popitem(last=False)
+            return True
+
+    def forget(self, item_hash):
+        with self.lock:
+            self.seen.pop(item_hash, None)
+
+    def choose_peers(self, exclude=None):
+        peers = [node for node in self.blockchain.peers if node != exclude and self.client.available(node)]
+        if len(peers) > self.fanout:
+            peers = random.sample(peers, self.fanout)
+        return peers
+
+    def announce(self, blocks=(), transactions=(), exclude=None):
+        """
+        Sends block and transaction hashes to peers without waiting for them
+
+        :param blocks: Hashes of blocks
+        :param transactions: Hashes of transactions
+        :param exclude: Peer the items came from
+        :return: None
+        """
+
+        for item_hash in list(blocks) + list(transactions):
+            self.mark_seen(item_hash)
+
+        peers = self.choose_peers(exclude)
+        if not peers:
+            return
+
+        data = json.dumps({
+            'from': self.blockchain.address,
+            'blocks': list(blocks),
+            'transactions': list(transactions)
+        })
+        for node in peers:
+            self.client.submit(self.client.post(node, "/inv", data))
+
+    def announce_block(self, block, exclude=None):
+        self.announce(blocks=[block.hash], exclude=exclude)
+
+    def announce_transactions(self, transactions, exclude=None):
+        if transactions:
+            self.announce(transactions=[tx.hash for tx in transactions], exclude=exclude)
+
+    def receive_inv(self, inv):
+        """
+        Starts downloading the announced items this node does not have
+
+        :param inv: Decoded /inv message
+        :return: None
+        """
+
+        node = inv.get('from')
+        if node not in self.blockchain.peers:
+            return #Only download from known peers
+
+        blockchain = self.blockchain
+        for block_hash in inv.get('blocks') or []:
+            if not isinstance(block_hash, str) or blockchain.knows_block(block_hash):
+                continue
+            if self.mark_seen(block_hash):
+                self.client.submit(self.fetch_block(node, block_hash))
+
+        tx_hashes = []
+        for tx_hash in inv.get('transactions') or []:
+            if not isinstance(tx_hash, str) or tx_hash in blockchain.mempool:
+                continue
+            if self.mark_seen(tx_hash):
+                tx_hashes.append(tx_hash)
+        if tx_hashes:
+            self.client.submit(self.fetch_transactions(node, tx_hashes))
+
+    async def fetch_block(self, node, block_hash):
+        """
+        Downloads an announced block and adds it, syncing with the peer if
+        the block's parent is not known
+
+        :param node: Address of the peer that announced the block
+        :param block_hash: Hash of the block
+        :return: None
+        """
+
+        blockchain = self.blockchain
+        block_json = await self.client.get_json(node, "/block/" + block_hash)
+        try:
+            block = blockchain.block_from_json(block_json)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            block = None
+
+        if block is None or block.hash != block_hash:
+            self.forget(block_hash) #Let another announcement retry it
+            return
+
+        #Blockchain methods take its lock and validate, they must not block the client's loop
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, blockchain.add_peer_block, block):
+            self.announce_block(block, exclude=node)
+        elif blockchain.tree.is_orphan(block.raw_hash) and await blockchain.sync_chain(node):
+            self.announce_block(blockchain.chain[-1], exclude=node)
+
+    async def fetch_transactions(self, node, tx_hashes):
+        """
+        Downloads announced transactions and adds the valid ones to the mempool
+
+        :param node: Address of the peer that announced them
+        :param tx_hashes: Hashes of the transactions
+        :return: None
+        """
+
+        responses = await asyncio.gather(*[self.client.get_json(node, "/tx/" + tx_hash) for tx_hash in tx_hashes])
+
+        transactions = []
+        for tx_hash, tx_json in zip(tx_hashes, responses):
+            try:
+                transaction = self.blockchain.transaction_from_json(tx_json)
+            except (AttributeError, KeyError, TypeError, ValueError):
+                transaction = None
+
+            if transaction is None or transaction.hash != tx_hash:
+                self.forget(tx_hash)
+            else:
+                transactions.append(transaction)
+
+        added = await asyncio.get_running_loop().run_in_executor(None, self.blockchain.receive_transactions, transactions)
+        self.announce_transactions(added, exclude=node)
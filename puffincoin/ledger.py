@@ -0,0 +1,180 @@
+from bisect import bisect_left, bisect_right
+
+
+class Ledger():
+    """
+    Account state derived from the blockchain.
+
+    Balances and transaction history are updated incrementally as blocks
+    are applied to or reverted from the tip, so lookups never have to scan
+    the chain. History is kept as chain-wide tx indexes rather than the
+    transactions themselves, so the state holds no blocks and can be saved
+    in a checkpoint.
+
+    Transactions with a nonce must use the next nonce of their sender, so
+    the nonces an address has used are exactly 0 to its amount of such
+    transactions, and seen and next nonce checks are a dict lookup.
+    """
+
+    def __init__(self):
+        self.balances = {}      # address -> balance
+        self.positions = {}     # address -> chain-wide tx index of each tx to or from the address
+        self.running = {}       # address -> balance after each history entry
+        self.tx_indexes = {}    # raw tx hash -> chain-wide tx index
+        self.sent = {}          # address -> chain-wide tx index of each tx with a nonce it sent
+        self.block_heights = {} # raw block hash -> height
+        self.block_offsets = [] # amount of transactions before each block
+        self.tx_count = 0
+
+    def __len__(self):
+        return len(self.block_offsets)
+
+    def apply_block(self, block):
+        """
+        Applies the transactions of a block on top of the current state
+
+        :param block: The block appended to the chain
+        :return: None
+        """
+
+        self.block_heights[block.raw_hash] = len(self.block_offsets)
+        self.block_offsets.append(self.tx_count)
+
+        for transaction in block.transactions:
+            index = self.tx_count
+            if transaction.raw_hash not in self.tx_indexes:
+                self.tx_indexes[transaction.raw_hash] = index
+            if transaction.nonce is not None:
+                self.sent.setdefault(transaction.sender, []).append(index)
+
+            amount = transaction.amount
+            delta = {transaction.reciever: amount}
+            delta[transaction.sender] = delta.get(transaction.sender, 0) - amount - transaction.fee
+
+            for address, change in delta.items():
+                bal = self.balances.get(address, 0) + change
+                self.balances[address] = bal
+                self.positions.setdefault(address, []).append(index)
+                self.running.setdefault(address, []).append(bal)
+
+            self.tx_count += 1
+
+    def revert_block(self, block):
+        """
+        Removes the transactions of the last applied block from the state
+
+        :param block: The block removed from the tip of the chain
+        :return: None
+        """
+
+        offset = self.block_offsets.pop()
+        if self.block_heights.get(block.raw_hash) == len(self.block_offsets):
+            del self.block_heights[block.raw_hash]
+
+        for i in range(len(block.transactions) - 1, -1, -1):
+            transaction = block.transactions[i]
+            index = offset + i
+
+            if self.tx_indexes.get(transaction.raw_hash) == index:
+                del self.tx_indexes[transaction.raw_hash]
+
+            sent = self.sent.get(transaction.sender)
+            if sent and sent[-1] == index:
+                sent.pop()
+                if not sent:
+                    del self.sent[transaction.sender]
+
+            for address in set([transaction.sender, transaction.reciever]):
+                positions = self.positions.get(address)
+                if not positions or positions[-1] != index:
+                    continue
+
+                positions.pop()
+                self.running[address].pop()
+
+                if positions:
+                    self.balances[address] = self.running[address][-1]
+                else:
+                    del self.positions[address]
+                    del self.running[address]
+                    del self.balances[address]
+
+        self.tx_count = offset
+
+    def rebuild(self, chain):
+        """
+        Recreates the state by replaying a whole chain
+
+        :param chain: List of blocks starting at the genesis block
+        :return: None
+        """
+
+        self.__init__()
+        for block in chain:
+            self.apply_block(block)
+
+    def get_balance(self, address):
+        return self.balances.get(address, 0)
+
+    def get_positions(self, address):
+        return self.positions.get(address, [])
+
+    def next_nonce(self, address):
+        return len(self.sent.get(address, ()))
+
+    def nonce_before(self, address, tx_index):
+        """
+        Gets the next nonce of an address before a chain-wide transaction index
+
+        :param address: The wallet address
+        :param tx_index: The index of the transaction to check before
+        :return: nonce (int)
+        """
+
+        return bisect_left(self.sent.get(address, ()), tx_index)
+
+    def has_transaction(self, transaction):
+        """
+        Checks if a transaction, or another one with its nonce, is already in the chain
+
+        :param transaction: The transaction
+        :return: True or False
+        """
+
+        if transaction.nonce is not None and transaction.raw_sender is not None:
+            return transaction.nonce < self.next_nonce(transaction.sender)
+        return transaction.raw_hash in self.tx_indexes
+
+    def locate(self, tx_index):
+        """
+        :param tx_index: Chain-wide index of a transaction
+        :return: (height of its block, index in the block)
+        """
+
+        height = bisect_right(self.block_offsets, tx_index) - 1
+        return height, tx_index - self.block_offsets[height]
+
+    def get_state(self):
+        return dict(self.__dict__)
+
+    def set_state(self, state):
+        self.__init__()
+        self.__dict__.update(state)
+
+    def balance_before(self, address, tx_index):
+        """
+        Gets the balance of an address before a chain-wide transaction index
+
+        :param address: The wallet address
+        :param tx_index: The index of the transaction to check before
+        :return: balance (int)
+        """
+
+        positions = self.positions.get(address)
+        if not positions:
+            return 0
+
+        i = bisect_left(positions, tx_index)
+        if i == 0:
+            return 0
+        return self.running[address][i - 1]
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+from collections import Counter
+
+from puffincoin.blockchain import HISTORY_LIMIT, Blockchain, Transaction
+from puffincoin.peers import PeerClient
+
+
+class LightWallet():
+    """
+    Wallet that asks full nodes about accounts instead of keeping the chain.
+
+    Every question goes to several nodes and an answer is only trusted when
+    at least quorum of them give the same one for the same tip. Trusted
+    answers are cached on disk by tip hash, so until a new block arrives
+    only the tip is asked for.
+    """
+
+    def __init__(self, nodes, quorum=2, max_nodes=8, cache_path="light_wallet.json", cache_tips=4):
+        """
+        :param nodes: Addresses of full nodes to start from
+        :param quorum: Amount of nodes that need to give the same answer
+        :param max_nodes: Most nodes asked
+        :param cache_path: File the answers are cached in, or None
+        :param cache_tips: Amount of tips answers are kept for
+        """
+
+        self.nodes = []
+        self.seeds = list(nodes)
+        self.quorum = quorum
+        self.max_nodes = max_nodes
+        self.cache_path = cache_path
+        self.cache_tips = cache_tips
+        self.cache = self.load_cache() # tip hash -> {request key -> answer}
+        self.nonces = {} # address -> next nonce after the transactions sent from here
+        self.client = PeerClient(concurrency=max_nodes)
+
+    def load_cache(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return cache if isinstance(cache, dict) else {}
+
+    def save_cache(self):
+        if self.cache_path is None:
+            return
+        try:
+            with open(self.cache_path + ".tmp", "w") as f:
+                json.dump(self.cache, f)
+            os.replace(self.cache_path + ".tmp", self.cache_path)
+        except OSError:
+            print("[ERROR] Could not save " + self.cache_path)
+
+    def cached(self, tip, key):
+        return self.cache.get(tip, {}).get(key)
+
+    def remember(self, tip, key, answer):
+        if tip not in self.cache:
+            self.cache[tip] = {}
+            while len(self.cache) > self.cache_tips:
+                del self.cache[next(iter(self.cache))]
+        self.cache[tip][key] = answer
+        self.save_cache()
+
+    def connect(self):
+        """
+        Finds full nodes to ask, starting from the seed nodes
+
+        :return: Amount of nodes found
+        """
+
+        return self.client.run(self.connect_async())
+
+    async def connect_async(self):
+        peer_lists = await asyncio.gather(*[self.client.get_json(node, "/peers") for node in self.seeds])
+
+        candidates = list(self.seeds)
+        for peer_list in peer_lists:
+            if isinstance(peer_list, list):
+                candidates += [node for node in peer_list if isinstance(node, str) and node not in candidates]
+
+        tips = await asyncio.gather(*[self.client.get_json(node, "/tip") for node in candidates])
+        self.nodes = [node for node, tip in zip(candidates, tips) if isinstance(tip, dict)][:self.max_nodes]
+        return len(self.nodes)
+
+    def add_node(self, node):
+        if node not in self.seeds:
+            self.seeds.append(node)
+        return self.connect()
+
+    async def ask(self, path, params=None):
+        """
+        Sends the same request to every node
+
+        :return: List of decoded answers of the nodes that answered
+        """
+
+        nodes = [node for node in self.nodes if self.client.available(node)]
+        answers = await asyncio.gather(*[self.client.get_json(node, path, params) for node in nodes])
+        return [answer for answer in answers if isinstance(answer, dict)]
+
+    async def post_all(self, path, data):
+        return await asyncio.gather(*[self.client.post(node, path, data) for node in self.nodes])
+
+    def agree(self, answers, what):
+        """
+        Picks the answer given by the most nodes
+
+        :param answers: Decoded answers
+        :param what: Description of the answer for messages
+        :return: The answer, or None if fewer than quorum nodes agree on it
+        """
+
+        if not answers:
+            print("[ERROR] No node answered the " + what + " request")
+            return None
+
+        votes = Counter(json.dumps(answer, sort_keys=True) for answer in answers)
+        best, count = votes.most_common(1)[0]
+
+        if count >= self.quorum:
+            return json.loads(best)
+        if len(votes) == 1:
+            print(f"[ERROR] Only {count} node(s) answered, the {what} could not be cross-checked")
+        return None
+
+    async def ask_agreed(self, path, what, params=None, retries=2):
+        #Nodes that just got a new block answer for another tip, asking again usually settles it
+        for attempt in range(retries + 1):
+            answer = self.agree(await self.ask(path, params), what)
+            if answer is not None:
+                return answer
+            await asyncio.sleep(1)
+
+        print("[ERROR] Fewer than " + str(self.quorum) + " nodes agree on the " + what)
+        return None
+
+    async def get_tip(self):
+        tip = await self.ask_agreed("/tip", "tip")
+        if tip is None:
+            return None
+        return tip.get("hash")
+
+    def get_balance(self, address):
+        """
+        Gets the balance of a wallet from the full nodes
+
+        :param address: The wallet address
+        :return: balance, or None if the nodes did not give a trusted answer
+        """
+
+        return self.client.run(self.get_balance_async(address))
+
+    async def get_balance_async(self, address):
+        key = "balance/" + address
+        tip = await self.get_tip()
+        answer = self.cached(tip, key) if tip is not None else None
+        if answer is None:
+            answer = await self.ask_agreed("/balance/" + address, "balance")
+            if answer is None or "balance" not in answer or "tip" not in answer:
+                return None
+            self.remember(answer["tip"], key, answer)
+        return answer["balance"]
+
+    def get_transaction_history(self, address):
+        """
+        Gets the transactions to or from a wallet from the full nodes
+
+        :param address: The wallet address
+        :return: List of (block height, Transaction), or None if the nodes did not give a trusted answer
+        """
+
+        return self.client.run(self.get_transaction_history_async(address))
+
+    async def get_transaction_history_async(self, address):
+        key = "history/" + address
+        tip = await self.get_tip()
+        answer = self.cached(tip, key) if tip is not None else None
+        if answer is None:
+            answer = await self.ask_history(address)
+            if answer is None:
+                return None
+            self.remember(answer["tip"], key, answer)
+
+        return [
+            (transaction_json["block"], Blockchain.transaction_from_json(transaction_json))
+            for transaction_json in answer["transactions"]
+            ]
+
+    async def ask_history(self, address):
+        """
+        Downloads a whole history page by page, checking each page with every node
+
+        :return: {"tip", "height", "total", "transactions"}, or None
+        """
+
+        path = "/history/" + address
+        first = await self.ask_agreed(path, "transaction history", {"from": 0, "limit": HISTORY_LIMIT})
+        if first is None or not {"tip", "total", "transactions"} <= first.keys():
+            return None
+
+        transactions = first["transactions"]
+        while len(transactions) < first["total"]:
+            page = await self.ask_agreed(path, "transaction history", {"from": len(transactions), "limit": HISTORY_LIMIT})
+            if page is None or page.get("tip") != first["tip"] or not page.get("transactions"):
+                return None #The chain moved on while paging, the next call starts over
+            transactions += page["transactions"]
+
+        first["transactions"] = transactions
+        return first
+
+    def send(self, private_key, sender, reciever, amount, fee=0):
+        """
+        Signs a transaction and sends it to the full nodes
+
+        :param private_key: Sender's private key
+        :param sender: Sender's public key (wallet address)
+        :param reciever: Reciever's public key (wallet address)
+        :param amount: Amount of PFC to be transfered
+        :param fee: PFC paid to the miner
+        :return: True if a node accepted the transaction
+        """
+
+        account = self.client.run(self.ask_agreed("/balance/" + sender, "nonce"))
+        if account is None or not isinstance(account.get("nonce"), int):
+            return False
+        #Transactions sent before may still be pending, their nonces are not on the chain yet
+        nonce = max(account["nonce"], self.nonces.get(sender, 0))
+
+        try:
+            transaction = Transaction(sender, reciever, amount, fee, nonce)
+        except ValueError as e:
+            print("[ERROR] " + str(e))
+            return False
+        transaction.sign(private_key)
+
+        responses = self.client.run(self.post_all("/transaction", json.dumps(Blockchain.transaction_to_json(transaction))))
+        if not any(response is not None and response[0] == 200 for response in responses):
+            print("[ERROR] Transaction was not accepted by any node")
+            return False
+
+        self.nonces[sender] = nonce + 1
+        return True
+
+    def close(self):
+        self.client.close()
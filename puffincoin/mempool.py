@@ -0,0 +1,286 @@
+import heapq
+from collections import deque
+
+
+class Mempool():
+    """
+    Pending transactions keyed by hash, in the order they arrived.
+
+    Keeps the amount each sender has pending so a new transaction can be
+    checked against the sender's balance minus what it already spends.
+
+    The transactions of each sender form a chain in nonce order, at most
+    max_chain long, and are mined in that order. A transaction is only
+    added if its nonce follows the last one of its sender's chain, or the
+    sender's next nonce on the chain if there is none. Block building draws from
+    a heap holding the first transaction of every chain by fee per byte,
+    so it never sorts the whole mempool. When full, the transaction with
+    the lowest fee per byte is evicted together with the later
+    transactions of its sender, unless it is from the sender of the new
+    transaction.
+
+    Both heaps are lazy: entries of transactions that left the mempool are
+    skipped when they come up, and a heap is rebuilt once most of it is
+    such entries.
+    """
+
+    def __init__(self, max_size=10000, max_chain=25):
+        self.max_size = max_size
+        self.max_chain = max_chain
+        self.transactions = {} # tx hash -> Transaction
+        self.spends = {} # sender -> total amount and fees of its pending transactions
+        self.chains = {} # sender -> deque of its pending tx hashes, oldest first
+        self.rates = {} # tx hash -> (fee per byte, arrival number)
+        self.best = [] # (-fee per byte, arrival number, tx hash) of the first transaction of each chain
+        self.worst = [] # (fee per byte, -arrival number, tx hash) of every transaction
+        self.arrivals = 0
+        self.version = 0 # Changes whenever transactions are added or removed
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def __iter__(self):
+        return iter(list(self.transactions.values()))
+
+    def __contains__(self, tx_hash):
+        return tx_hash in self.transactions
+
+    def get(self, tx_hash):
+        return self.transactions.get(tx_hash)
+
+    def pending_spend(self, sender):
+        return self.spends.get(sender, 0)
+
+    def pending_count(self, sender):
+        return len(self.chains.get(sender, ()))
+
+    def add(self, transaction, balance=None, nonce=None):
+        """
+        Adds a transfer if it is new, its sender can afford it, it has
+        the sender's next nonce and its sender's chain is not full
+
+        :param transaction: The transaction
+        :param balance: Confirmed balance of the sender, None to skip the check
+        :param nonce: Next nonce of the sender on the chain, None to skip the check
+        :return: True if the transaction was added
+        """
+
+        if transaction.hash in self.transactions or transaction.raw_sender is None:
+            return False #Rewards are only created by the miner in its block template
+
+        sender = transaction.sender
+        chain = self.chains.get(sender)
+        if chain is not None and len(chain) >= self.max_chain:
+            return False
+
+        if nonce is not None and transaction.nonce != nonce + self.pending_count(sender):
+            return False
+
+        if balance is not None and self.pending_spend(sender) + transaction.cost > balance:
+            return False
+
+        rate = transaction.fee / transaction.size()
+        while len(self.transactions) >= self.max_size:
+            lowest = self.lowest()
+            if lowest is None or self.rates[lowest.hash][0] >= rate:
+                return False #Everything pending pays at least as much
+            if lowest.sender == sender:
+                return False #Evicting the sender's own earlier transactions would leave a nonce gap
+            self.evict(lowest)
+
+        self.insert(transaction, rate)
+        self.version += 1
+        return True
+
+    def insert(self, transaction, rate, first=False):
+        tx_hash = transaction.hash
+        sender = transaction.sender
+        self.arrivals += 1
+
+        self.transactions[tx_hash] = transaction
+        self.spends[sender] = self.pending_spend(sender) + transaction.cost
+        self.rates[tx_hash] = (rate, self.arrivals)
+        heapq.heappush(self.worst, (rate, -self.arrivals, tx_hash))
+
+        chain = self.chains.setdefault(sender, deque())
+        if first:
+            chain.appendleft(tx_hash)
+        else:
+            chain.append(tx_hash)
+        if chain[0] == tx_hash:
+            heapq.heappush(self.best, (-rate, self.arrivals, tx_hash))
+
+    def lowest(self):
+        """
+        :return: The pending transaction with the lowest fee per byte, newest first, or None
+        """
+
+        while self.worst:
+            tx_hash = self.worst[0][2]
+            if tx_hash in self.transactions:
+                return self.transactions[tx_hash]
+            heapq.heappop(self.worst)
+        return None
+
+    def evict(self, transaction):
+        """
+        Removes a transaction and the later transactions of its sender
+
+        :param transaction: The transaction
+        :return: None
+        """
+
+        chain = self.chains[transaction.sender]
+        while chain and chain[-1] != transaction.hash:
+            self.remove(chain[-1])
+        self.remove(transaction.hash)
+
+    def remove(self, tx_hash):
+        """
+        Removes a transaction
+
+        :param tx_hash: Hash of the transaction
+        :return: The removed transaction, or None if it was not pending
+        """
+
+        transaction = self.transactions.pop(tx_hash, None)
+        if transaction is None:
+            return None
+
+        sender = transaction.sender
+        spend = self.spends[sender] - transaction.cost
+        if spend:
+            self.spends[sender] = spend
+        else:
+            del self.spends[sender]
+
+        del self.rates[tx_hash]
+        chain = self.chains[sender]
+        if chain[0] == tx_hash:
+            chain.popleft()
+            if chain:
+                rate, arrival = self.rates[chain[0]]
+                heapq.heappush(self.best, (-rate, arrival, chain[0]))
+        else:
+            chain.remove(tx_hash)
+        if not chain:
+            del self.chains[sender]
+
+        self.compact()
+        self.version += 1
+        return transaction
+
+    def compact(self):
+        if len(self.best) > 2 * len(self.chains) + 64:
+            self.best = [
+                (-self.rates[chain[0]][0], self.rates[chain[0]][1], chain[0]) for chain in self.chains.values()
+                ]
+            heapq.heapify(self.best)
+
+        if len(self.worst) > 2 * len(self.transactions) + 64:
+            self.worst = [(rate, -arrival, tx_hash) for tx_hash, (rate, arrival) in self.rates.items()]
+            heapq.heapify(self.worst)
+
+    def remove_used(self, sender, nonce):
+        """
+        Removes the pending transactions of a sender whose nonces the chain
+        already used, after a block with other transactions of the sender
+
+        :param sender: The sender
+        :param nonce: Next nonce of the sender on the chain
+        :return: None
+        """
+
+        chain = self.chains.get(sender)
+        while chain and self.transactions[chain[0]].nonce is not None and self.transactions[chain[0]].nonce < nonce:
+            self.remove(chain[0])
+
+    def remove_block(self, block):
+        """
+        Removes all transactions included in a block
+
+        :param block: The block
+        :return: None
+        """
+
+        for transaction in block.transactions:
+            self.remove(transaction.hash)
+
+    def reinsert(self, transactions, balance_of, nonce_of):
+        """
+        Puts back transactions of blocks that left the chain. They go before
+        the pending transactions of their senders, since their nonces are lower.
+
+        :param transactions: Transactions in chain order
+        :param balance_of: Function returning the confirmed balance of an address
+        :param nonce_of: Function returning the next nonce of an address on the chain
+        :return: Amount of transactions put back
+        """
+
+        added = 0
+        senders = set()
+        for transaction in reversed(transactions):
+            sender = transaction.sender
+            if transaction.raw_sender is None or transaction.nonce is None or transaction.hash in self.transactions:
+                continue #Rewards belong to the block that paid them, transactions without nonces could be replayed
+            senders.add(sender)
+            if transaction.nonce < nonce_of(sender):
+                continue #The new chain used the nonce
+            if self.pending_spend(sender) + transaction.cost > balance_of(sender):
+                continue
+
+            chain = self.chains.get(sender)
+            if chain is not None and self.transactions[chain[0]].nonce != transaction.nonce + 1:
+                continue
+            if chain is not None and len(chain) >= self.max_chain:
+                self.remove(chain[-1]) #The newest pending transaction gives way to the older one
+
+            self.insert(transaction, transaction.fee / transaction.size(), first=True)
+            added += 1
+
+        for sender in senders:
+            #A chain that does not start at the sender's next nonce could never be mined
+            chain = self.chains.get(sender)
+            if chain and self.transactions[chain[0]].nonce != nonce_of(sender):
+                self.evict(self.transactions[chain[0]])
+
+        while len(self.transactions) > self.max_size:
+            self.evict(self.lowest())
+
+        if added:
+            self.version += 1
+        return added
+
+    def take(self, amount):
+        """
+        Returns the pending transactions paying the most per byte without
+        removing them, keeping each sender's transactions in order
+
+        :param amount: Most transactions to return
+        :return: List of transactions
+        """
+
+        heap = list(self.best) #A copy of a heap is a heap
+        taken = {} # sender -> amount of its transactions taken
+
+        transactions = []
+        while heap and len(transactions) < amount:
+            rate, arrival, tx_hash = heapq.heappop(heap)
+            transaction = self.transactions.get(tx_hash)
+            if transaction is None:
+                continue
+
+            sender = transaction.sender
+            chain = self.chains[sender]
+            position = taken.get(sender, 0)
+            if position >= len(chain) or chain[position] != tx_hash:
+                continue #Left over from a transaction that was first in its chain
+
+            transactions.append(transaction)
+            taken[sender] = position + 1
+            if position + 1 < len(chain):
+                next_hash = chain[position + 1]
+                next_rate, next_arrival = self.rates[next_hash]
+                heapq.heappush(heap, (-next_rate, next_arrival, next_hash))
+
+        return transactions
@@ -0,0 +1,82 @@
+import hashlib
+
+EMPTY_ROOT = bytes(32) #Root of a block without transactions
+
+
+def hash_pair(left, right):
+    return hashlib.sha256(left + right).digest()
+
+
+def verify_proof(leaf, index, proof, root):
+    """
+    Checks that a transaction hash is part of a Merkle tree
+
+    :param leaf: Raw hash of the transaction
+    :param index: Position of the transaction in its block
+    :param proof: Raw sibling hashes from the leaf up, from MerkleTree.proof
+    :param root: Raw Merkle root the proof should lead to
+    :return: True if the proof is valid
+    """
+
+    if index < 0 or index >= 2 ** len(proof):
+        return False
+
+    node = leaf
+    for sibling in proof:
+        if index % 2:
+            node = hash_pair(sibling, node)
+        else:
+            node = hash_pair(node, sibling)
+        index //= 2
+    return node == root
+
+
+class MerkleTree():
+    """
+    Merkle tree of the transaction hashes of a block.
+
+    Every level is kept, so inclusion proofs are read from the tree instead
+    of hashing the block's transactions again.
+    """
+
+    __slots__ = ("levels",)
+
+    def __init__(self, hashes):
+        """
+        :param hashes: List of raw 32 byte hashes
+        """
+
+        level = list(hashes)
+        self.levels = [level]
+        while len(level) > 1:
+            if len(level) % 2:
+                level = level + [level[-1]]
+            level = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+            self.levels.append(level)
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    @property
+    def root(self):
+        if not self.levels[0]:
+            return EMPTY_ROOT
+        return self.levels[-1][0]
+
+    def proof(self, index):
+        """
+        Gets the hashes needed to link a transaction to the root
+
+        :param index: Position of the transaction in its block
+        :return: List of raw sibling hashes, from the leaf up
+        """
+
+        if not 0 <= index < len(self):
+            raise IndexError("transaction index out of range")
+
+        proof = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            proof.append(level[sibling] if sibling < len(level) else level[index])
+            index //= 2
+        return proof
@@ -0,0 +1,176 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+CHECK_INTERVAL = 20000 #Attempts between checks for a cancelled job
+
+
+def search(midstate, target, start, step, count):
+    """
+    Tries nonses start, start + step, ... for a hash below target
+
+    :param midstate: sha256 object that hashed the block prefix (Block.header_midstate)
+    :param target: 32 byte target
+    :param start: First nonse to try
+    :param step: Distance between nonses tried
+    :param count: Amount of nonses to try
+    :return: (nonse or None, attempts)
+    """
+
+    nonse = start
+    for i in range(count):
+        header = midstate.copy()
+        header.update(b'%d"' % nonse)
+        if header.digest() <= target:
+            return nonse, i + 1
+        nonse += step
+    return None, count
+
+
+def _work(worker_id, jobs, results, current_job):
+    signal.signal(signal.SIGINT, signal.SIG_IGN) #CTRL+C is handled by the main process
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+
+        job_id, prefix, target, start, step = job
+        midstate = hashlib.sha256(prefix)
+        nonse = start
+        attempts = 0
+        begin = time.perf_counter()
+
+        while current_job.value == job_id:
+            found, tried = search(midstate, target, nonse, step, CHECK_INTERVAL)
+            attempts += tried
+            if found is not None:
+                results.put(("found", job_id, worker_id, found))
+                break
+            nonse += step * tried
+
+        results.put(("stats", job_id, worker_id, attempts, time.perf_counter() - begin))
+
+
+class Miner():
+    """
+    Proof of work engine splitting the nonse space across worker processes.
+
+    Worker i tries nonses start + i, start + i + n, ... for n workers, hashing
+    the constant block prefix once per job and only feeding in the nonse per
+    attempt. The processes are started once and reused for every block; a shared job id
+    tells them to stop as soon as one of them finds a solution, or when a
+    new job replaces the current one.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = []
+        self.job_id = 0
+        self.attempts = 0 #Hashes tried by all workers since the pool started
+        self.worker_attempts = [] #Hashes tried by each worker since the pool started
+
+    def start(self):
+        if self.processes:
+            return
+
+        self.current_job = multiprocessing.Value("l", 0)
+        self.results = multiprocessing.Queue()
+        self.jobs = []
+        self.worker_attempts += [0] * (self.workers - len(self.worker_attempts))
+
+        for worker_id in range(self.workers):
+            jobs = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_work,
+                args=(worker_id, jobs, self.results, self.current_job),
+                daemon=True
+                )
+            process.start()
+            self.jobs.append(jobs)
+            self.processes.append(process)
+
+    def stop(self):
+        """
+        Stops the worker processes
+
+        :return: None
+        """
+
+        if not self.processes:
+            return
+
+        self.current_job.value = 0
+        for jobs in self.jobs:
+            jobs.put(None)
+        for process in self.processes:
+            process.join()
+        self.processes = []
+
+    def start_job(self, block):
+        """
+        Hands a block to the workers, replacing the job they work on
+
+        :param block: The block to mine
+        :return: Id of the job
+        """
+
+        self.start()
+
+        self.job_id += 1
+        job_id = self.job_id
+        self.current_job.value = job_id
+
+        prefix = block.header_prefix()
+        target = block.target.to_bytes(32, "big")
+        for worker_id, jobs in enumerate(self.jobs):
+            jobs.put((job_id, prefix, target, block.nonse + worker_id, self.workers))
+        return job_id
+
+    def cancel(self):
+        """
+        Stops the workers working on the current job
+
+        :return: None
+        """
+
+        if self.processes:
+            self.current_job.value = 0
+
+    def next_message(self, timeout=None):
+        """
+        :param timeout: Seconds to wait, None to wait until a message arrives
+        :return: The next message of a worker, or None after the timeout
+        """
+
+        try:
+            message = self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+        if message[0] == "stats":
+            self.attempts += message[3]
+            self.worker_attempts[message[2]] += message[3]
+        return message
+
+    def wait(self, job_id, timeout):
+        """
+        Waits for a worker to solve a job
+
+        :param job_id: Id from start_job
+        :param timeout: Most seconds to wait
+        :return: The nonse found, or None if it was not found in time
+        """
+
+        deadline = time.monotonic() + timeout
+        while True:
+            message = self.next_message(max(deadline - time.monotonic(), 0))
+            if message is None:
+                return None
+            if message[0] == "found" and message[1] == job_id:
+                if self.current_job.value == job_id:
+                    self.current_job.value = 0
+                return message[3]
@@ -0,0 +1,106 @@
+import threading
+import time
+
+
+class MiningService():
+    """
+    Mines in the background on a block template that follows the chain.
+
+    The template holds a reward for the miner and the oldest pending
+    transactions. When a block arrives from a peer or the mempool changes,
+    a fresh template is handed to the same worker processes, which drop the
+    old job at their next check. Work thrown away because the tip moved is
+    counted as stale.
+    """
+
+    def __init__(self, blockchain, reciever, poll_interval=0.2):
+        """
+        :param blockchain: The blockchain to mine on
+        :param reciever: Wallet address the block rewards go to
+        :param poll_interval: Seconds between checks for a new tip or mempool change
+        """
+
+        self.blockchain = blockchain
+        self.miner = blockchain.miner
+        self.reciever = reciever
+        self.poll_interval = poll_interval
+        self.thread = None
+        self.running = False
+        self.template = None
+        self.blocks_found = 0
+        self.templates = 0 #Templates handed to the workers
+        self.stale_work = 0 #Templates dropped or blocks rejected because the tip moved
+        self.started = None
+        self.start_attempts = 0
+        self.start_worker_attempts = []
+
+    def start(self):
+        if self.running:
+            return
+
+        self.running = True
+        self.started = time.monotonic()
+        self.start_attempts = self.miner.attempts
+        self.start_worker_attempts = list(self.miner.worker_attempts)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self.running = False
+        self.thread.join()
+        self.miner.cancel()
+        self.template = None
+
+    def status(self):
+        """
+        :return: dict with the state of the service
+        """
+
+        template = self.template
+        seconds = time.monotonic() - self.started if self.started is not None else 0
+        worker_attempts = list(self.miner.worker_attempts)
+        for worker, attempts in enumerate(self.start_worker_attempts): #Workers started later began at 0
+            worker_attempts[worker] -= attempts
+        return {
+            'running': self.running,
+            'height': template.index if template is not None else None,
+            'transactions': len(template.transactions) if template is not None else 0,
+            'hashrate': (self.miner.attempts - self.start_attempts) / seconds if seconds > 0 else 0,
+            'worker_hashrates': [attempts / seconds if seconds > 0 else 0 for attempts in worker_attempts],
+            'blocks_found': self.blocks_found,
+            'templates': self.templates,
+            'stale_work': self.stale_work
+        }
+
+    def run(self):
+        blockchain = self.blockchain
+
+        while self.running:
+            block = blockchain.create_template(self.reciever)
+            mempool_version = blockchain.mempool.version
+            self.template = block
+            self.templates += 1
+            job_id = self.miner.start_job(block)
+
+            while self.running:
+                nonse = self.miner.wait(job_id, self.poll_interval)
+
+                if nonse is not None:
+                    block.nonse = nonse
+                    block.hash = block.hash_block()
+                    if blockchain.submit_block(block):
+                        self.blocks_found += 1
+                        print("[INFO] Mined block %s" %(block.index))
+                    else:
+                        self.stale_work += 1
+                    break
+
+                if blockchain.get_last_block().raw_hash != block.raw_prev:
+                    self.stale_work += 1
+                    break
+
+                if blockchain.mempool.version != mempool_version:
+                    break
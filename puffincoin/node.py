@@ -1,12 +1,21 @@
+import hashlib
 import json
 import time
 
-from flask import Flask, request
+import waitress
+from flask import Flask, Response, request
+from waitress import wasyncore
+
+from puffincoin.blockchain import BLOCKS_LIMIT, HEADERS_LIMIT, HISTORY_LIMIT
+from puffincoin.streaming import choose_encoding, compress, encode_json, json_list
+from puffincoin.views import ViewCache
 
 class Node():
     def __init__(self, blockchain):
         self.app = Flask(__name__)
         self.blockchain = blockchain
+        self.views = ViewCache(blockchain)
+        self.server = None
 
         @self.app.route('/', methods=['GET'])
         def home():
@@ -19,19 +28,166 @@ class Node():
 
         @self.app.route('/chain', methods=['GET'])
         def send_chain():
+            chain = self.blockchain.snapshot()
+            encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+            etag = self.views.chain_etag(chain, encoding)
+            return self.stream_blocks(chain, 0, len(chain), etag, encoding, b'{"chain":[', b']}')
+
+        @self.app.route('/tip', methods=['GET'])
+        def send_tip():
+            tip = self.blockchain.snapshot().tip
+            etag = f"tip-{tip.index}-{tip.hash}"
+            if request.if_none_match.contains(etag):
+                return self.not_modified(etag)
+
+            response = {
+                'height': tip.index,
+                'hash': tip.hash
+            }
+
+            return self.json_response(encode_json(response), etag)
+
+        @self.app.route('/blocks', methods=['GET'])
+        def send_blocks():
+            start = request.args.get('from', 0, type=int)
+            limit = min(request.args.get('limit', BLOCKS_LIMIT, type=int), BLOCKS_LIMIT)
+            start = max(start, 0)
+            chain = self.blockchain.snapshot()
+            encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+            etag = self.views.blocks_etag(chain, start, limit, encoding)
+
+            return self.stream_blocks(chain, start, start + limit, etag, encoding)
+
+        @self.app.route('/headers', methods=['GET'])
+        def send_headers():
+            start = request.args.get('from', 0, type=int)
+            limit = min(request.args.get('limit', HEADERS_LIMIT, type=int), HEADERS_LIMIT)
+            start = max(start, 0)
+            chain = self.blockchain.snapshot()
+            encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+            etag = self.views.blocks_etag(chain, start, limit, encoding, "headers")
+
+            if request.if_none_match.contains(etag):
+                return self.not_modified(etag)
+
+            headers = (self.views.header_json(chain[i]) for i in range(start, min(start + limit, len(chain))))
+            response = Response(compress(json_list(headers, lambda data: data), encoding), mimetype="application/json")
+            response.headers["Vary"] = "Accept-Encoding"
+            response.set_etag(etag)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+            return response
+
+        @self.app.route('/block/<block_hash>', methods=['GET'])
+        def send_block(block_hash):
+            block = self.blockchain.get_block(block_hash)
+            if block is None:
+                return "Block not found.", 404
+
+            etag = "block-" + block.hash #Blocks never change
+            if request.if_none_match.contains(etag):
+                return self.not_modified(etag)
+            return self.json_response(self.views.block_json(block), etag)
+
+        @self.app.route('/tx/<tx_hash>', methods=['GET'])
+        def send_transaction(tx_hash):
+            transaction = self.blockchain.mempool.get(tx_hash)
+            if transaction is None:
+                return "Transaction not found.", 404
+            return self.json_response(encode_json(self.blockchain.transaction_to_json(transaction)), "tx-" + tx_hash)
+
+        @self.app.route('/proof/<tx_hash>', methods=['GET'])
+        def send_proof(tx_hash):
+            proof = self.blockchain.get_proof(tx_hash)
+            if proof is None:
+                return "Transaction not found.", 404
+
+            etag = "proof-" + tx_hash + "-" + proof['header']['hash'] #Only a reorg moves the transaction
+            if request.if_none_match.contains(etag):
+                return self.not_modified(etag)
+            return self.json_response(encode_json(proof), etag)
+
+        @self.app.route('/balance/<address>', methods=['GET'])
+        def send_balance(address):
+            balance, nonce, tip = self.blockchain.get_account(address)
+            etag = "balance-" + address + "-" + tip.hash
+            if request.if_none_match.contains(etag):
+                return self.not_modified(etag)
+
             response = {
-                'chain': self.blockchain.to_json()
+                'address': address,
+                'balance': balance,
+                'nonce': nonce,
+                'height': tip.index,
+                'tip': tip.hash
             }
 
-            return json.dumps(response)
+            return self.json_response(encode_json(response), etag)
+
+        @self.app.route('/history/<address>', methods=['GET'])
+        def send_history(address):
+            start = max(request.args.get('from', 0, type=int), 0)
+            limit = min(request.args.get('limit', HISTORY_LIMIT, type=int), HISTORY_LIMIT)
+            tip, total, transactions = self.blockchain.get_address_history(address, start, max(limit, 0))
+            etag = f"history-{address}-{start}-{limit}-{tip.hash}"
+            if request.if_none_match.contains(etag):
+                return self.not_modified(etag)
+
+            response = {
+                'address': address,
+                'height': tip.index,
+                'tip': tip.hash,
+                'total': total,
+                'transactions': [
+                    dict(self.blockchain.transaction_to_json(transaction), block=height) for height, transaction in transactions
+                    ]
+            }
+
+            return self.json_response(encode_json(response), etag)
+
+        @self.app.route('/transaction', methods=['POST'])
+        def receive_transaction():
+            try:
+                transaction = self.blockchain.transaction_from_json(json.loads(request.data))
+            except (AttributeError, KeyError, TypeError, ValueError):
+                return "Invalid transaction.", 400
+
+            if transaction.raw_sender is None:
+                return "Rewards are only created by miners.", 400
+
+            added = self.blockchain.receive_transactions([transaction])
+            if not added:
+                return "Transaction was not added.", 400
+
+            self.blockchain.gossip.announce_transactions(added)
+            return "Transaction added."
+
+        @self.app.route('/inv', methods=['POST'])
+        def receive_inv():
+            try:
+                inv = json.loads(request.data)
+            except ValueError:
+                return "Invalid inv.", 400
+            if not isinstance(inv, dict):
+                return "Invalid inv.", 400
+
+            self.blockchain.gossip.receive_inv(inv)
+            return "OK"
 
         @self.app.route('/peers', methods=['GET'])
         def send_peers():
-            return json.dumps(list(self.blockchain.peers))
+            data = encode_json(sorted(self.blockchain.peers))
+            etag = "peers-" + hashlib.sha256(data).hexdigest()[:16]
+            if request.if_none_match.contains(etag):
+                return self.not_modified(etag)
+            return self.json_response(data, etag)
 
         @self.app.route('/transactions', methods=['GET'])
         def send_transactions():
-            return json.dumps(self.blockchain.pending_transactions_json())
+            etag, data = self.views.transactions_json()
+            if request.if_none_match.contains(etag):
+                return self.not_modified(etag)
+            return self.json_response(data, etag)
 
         @self.app.route('/register', methods=['POST'])
         def register_node():
@@ -39,10 +195,108 @@ class Node():
             self.blockchain.add_nodes([addr])
             return "Registered node."
 
-    def update_chain_loop(self):
+    def stream_blocks(self, chain, start, stop, etag, encoding, head=b"[", tail=b"]"):
+        """
+        Creates a response encoding blocks one at a time, compressed with
+        gzip or deflate if the client accepts it
+
+        :param chain: ChainSnapshot
+        :param start: Height of the first block
+        :param stop: Height after the last block
+        :param etag: ETag of the response
+        :param encoding: "gzip", "deflate" or None
+        :param head: Bytes before the first block
+        :param tail: Bytes after the last block
+        :return: Flask Response, 304 if the client already has this version
+        """
+
+        if request.if_none_match.contains(etag):
+            return self.not_modified(etag)
+
+        body = self.views.get_body(etag) if encoding else None
+        if body is None:
+            blocks = chain.iter_json(self.views.block_json, start, stop)
+            body = compress(json_list(blocks, lambda data: data, head, tail), encoding)
+            if encoding:
+                body = self.views.save_body(etag, body)
+
+        response = Response(body, mimetype="application/json")
+        response.headers["Vary"] = "Accept-Encoding"
+        response.set_etag(etag)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return response
+
+    def json_response(self, data, etag):
+        response = Response(data, mimetype="application/json")
+        response.set_etag(etag)
+        return response
+
+    def not_modified(self, etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    def update_chain_loop(self, interval=15):
+        """
+        Polls peers now and then to catch up on anything gossip missed
+
+        :param interval: Seconds between polls
+        :return: None
+        """
+
         while True:
             self.blockchain.update_chain()
-            time.sleep(1)
+            time.sleep(interval)
+
+    def start(self, host="0.0.0.0", port=8222, threads=8, connection_limit=100, channel_timeout=30):
+        """
+        Serves the node API with waitress until stop is called
+
+        Requests are handled by a pool of threads in this process, so they all
+        share the blockchain. Connections are kept alive between requests and
+        closed after channel_timeout seconds without activity.
+
+        :param host: Address to listen on
+        :param port: Port to listen on
+        :param threads: Amount of threads handling requests
+        :param connection_limit: Most open connections
+        :param channel_timeout: Seconds before an inactive connection is closed
+        :return: None
+        """
+
+        self.server = waitress.create_server(
+            self.app,
+            host=host,
+            port=port,
+            threads=threads,
+            connection_limit=connection_limit,
+            channel_timeout=channel_timeout,
+            ident="PuffinCoin"
+            )
+        self.server.run()
+
+    def stop(self, timeout=5):
+        """
+        Stops accepting connections, lets running requests finish and
+        closes the server
+
+        :param timeout: Most seconds to wait for running requests
+        :return: None
+        """
+
+        server = self.server
+        if server is None:
+            return
+        self.server = None
+
+        #Sockets are closed on the server's own thread
+        server.trigger.pull_trigger(lambda: wasyncore.dispatcher.close(server))
+
+        dispatcher = server.task_dispatcher
+        end = time.monotonic() + timeout
+        while (dispatcher.queue or dispatcher.active_count) and time.monotonic() < end:
+            time.sleep(0.05)
 
-    def start(self, host="0.0.0.0", port=8222):
-        self.app.run(host=host, port=port)
+        dispatcher.shutdown(timeout=max(end - time.monotonic(), 0))
+        server.trigger.pull_trigger(lambda: wasyncore.close_all(server._map))
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import threading
+import time
+
+import aiohttp
+
+from puffincoin.streaming import CHUNK_SIZE, JSONListParser
+
+BACKOFF_BASE = 1 #Seconds a peer is skipped after its first failure
+BACKOFF_MAX = 300
+
+NOT_MODIFIED = object() #Returned by conditional requests when the peer answered 304
+
+
+class PeerStats():
+    def __init__(self):
+        self.latency = None #Moving average of response time in seconds
+        self.failures = 0 #Failures in a row
+        self.total_requests = 0
+        self.total_failures = 0
+        self.backoff_until = 0
+
+    def __str__(self):
+        latency = "-" if self.latency is None else f"{round(self.latency * 1000)}ms"
+        return f"latency: {latency}  failures: {self.total_failures}/{self.total_requests}"
+
+    def available(self):
+        return time.monotonic() >= self.backoff_until
+
+    def success(self, latency):
+        self.total_requests += 1
+        self.failures = 0
+        self.backoff_until = 0
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = 0.8 * self.latency + 0.2 * latency
+
+    def failure(self):
+        self.total_requests += 1
+        self.total_failures += 1
+        self.failures += 1
+        backoff = min(BACKOFF_BASE * 2 ** (self.failures - 1), BACKOFF_MAX)
+        self.backoff_until = time.monotonic() + backoff
+
+
+class PeerClient():
+    """
+    Asynchronous HTTP client for talking to peers.
+
+    Requests run on an event loop in a background thread. Connections are
+    kept alive and pooled per peer, the amount of requests in flight is
+    bounded, and peers that keep failing are skipped with exponential backoff.
+    Conditional requests remember each peer's ETag so unchanged data is not
+    downloaded again.
+    """
+
+    def __init__(self, concurrency=16, timeout=4):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.stats = {}
+        self.etags = {} # (node, path) -> ETag of the last 200 response
+        self.loop = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, daemon=True).start()
+            self.run(self.open_session())
+
+    async def open_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=2,
+            keepalive_timeout=30
+            )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    def close(self):
+        with self.lock:
+            if self.loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = None
+
+    def run(self, coro):
+        """
+        Runs a coroutine on the client's event loop from another thread
+
+        :param coro: The coroutine
+        :return: Its result
+        """
+
+        return self.submit(coro).result()
+
+    def submit(self, coro):
+        """
+        Schedules a coroutine on the client's event loop without waiting for it
+
+        :param coro: The coroutine
+        :return: concurrent.futures.Future of its result
+        """
+
+        if self.loop is None:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def get_stats(self, node):
+        stats = self.stats.get(node)
+        if stats is None:
+            stats = self.stats[node] = PeerStats()
+        return stats
+
+    def available(self, node):
+        return self.get_stats(node).available()
+
+    def forget_etags(self, path):
+        """
+        Makes the next conditional request to a path download it again from every peer
+
+        :param path: Path of the endpoint
+        :return: None
+        """
+
+        for key in [key for key in self.etags if key[1] == path]:
+            self.etags.pop(key, None)
+
+    async def request(self, method, node, path, params=None, data=None, read=None, conditional=False):
+        """
+        Sends a request to a peer
+
+        :param method: HTTP method
+        :param node: Address of the peer
+        :param path: Path of the endpoint
+        :param params: Query parameters (dict)
+        :param data: Request body
+        :param read: Coroutine function reading the body of a 200 response, optional
+        :param conditional: Send the ETag of the last response, so an unchanged resource returns 304
+        :return: (status, body bytes or result of read), or None if the peer is backing off or failed
+        """
+
+        stats = self.get_stats(node)
+        if not stats.available():
+            return None
+
+        headers = {}
+        etag = self.etags.get((node, path)) if conditional else None
+        if etag:
+            headers["If-None-Match"] = etag
+
+        async with self.semaphore:
+            start = time.monotonic()
+            try:
+                async with self.session.request(method, f'http://{node}{path}', params=params, data=data, headers=headers) as response:
+                    status = response.status
+                    if read is not None and status == 200:
+                        body = await read(response)
+                    else:
+                        body = await response.read()
+
+                    if conditional and status == 200:
+                        if "ETag" in response.headers:
+                            self.etags[(node, path)] = response.headers["ETag"]
+                        else:
+                            self.etags.pop((node, path), None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError, KeyError, TypeError):
+                stats.failure()
+                return None
+
+        stats.success(time.monotonic() - start)
+        return status, body
+
+    async def get(self, node, path, params=None):
+        return await self.request("GET", node, path, params=params)
+
+    async def post(self, node, path, data):
+        return await self.request("POST", node, path, data=data)
+
+    async def get_json(self, node, path, params=None, conditional=False):
+        """
+        Requests json from a peer
+
+        :param conditional: Return NOT_MODIFIED if the json did not change since the last request
+        :return: Decoded json, NOT_MODIFIED, or None if the request failed
+        """
+
+        response = await self.request("GET", node, path, params=params, conditional=conditional)
+        if response is not None and response[0] == 304 and conditional:
+            return NOT_MODIFIED
+        if response is None or response[0] != 200:
+            return None
+
+        try:
+            return json.loads(response[1])
+        except ValueError:
+            return None
+
+    async def get_json_list(self, node, path, params=None, convert=None):
+        """
+        Requests a json list from a peer, decoding items while they arrive
+
+        :param node: Address of the peer
+        :param path: Path of the endpoint
+        :param params: Query parameters (dict)
+        :param convert: Function applied to each item as soon as it is decoded
+        :return: List of items, or None if the request failed
+        """
+
+        async def read(response):
+            parser = JSONListParser(convert)
+            items = []
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                items += parser.feed(chunk)
+            parser.close()
+            return items
+
+        response = await self.request("GET", node, path, params=params, read=read)
+        if response is None or response[0] != 200:
+            return None
+        return response[1]
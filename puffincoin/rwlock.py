@@ -0,0 +1,81 @@
+import threading
+from contextlib import contextmanager
+
+
+class RWLock():
+    """
+    Lock that lets many threads read at once while writers run alone.
+
+    Waiting writers go before new readers so a steady stream of requests
+    cannot hold back a block. A thread can take the lock again while holding
+    it, and a writer can also read.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0 #Threads holding the read lock
+        self.writer = None #Thread holding the write lock
+        self.writes = 0 #Times the writer took the write lock
+        self.waiting_writers = 0
+        self.local = threading.local() #Read lock count of each thread
+
+    def acquire_read(self):
+        reads = getattr(self.local, "reads", 0)
+        if reads or self.writer is threading.current_thread():
+            self.local.reads = reads + 1
+            return
+
+        with self.condition:
+            while self.writer is not None or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+        self.local.reads = 1
+
+    def release_read(self):
+        self.local.reads -= 1
+        if self.local.reads or self.writer is threading.current_thread():
+            return
+
+        with self.condition:
+            self.readers -= 1
+            if self.readers == 0:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        thread = threading.current_thread()
+        with self.condition:
+            if self.writer is thread:
+                self.writes += 1
+                return
+            if getattr(self.local, "reads", 0):
+                raise RuntimeError("cannot write while holding the read lock")
+
+            self.waiting_writers += 1
+            while self.writer is not None or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = thread
+            self.writes = 1
+
+    def release_write(self):
+        with self.condition:
+            self.writes -= 1
+            if self.writes == 0:
+                self.writer = None
+                self.condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,172 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import nacl.exceptions
+import nacl.signing
+
+POOL_THRESHOLD = 2000 #Smallest batch that is split across the process pool
+
+_worker_keys = {}
+
+
+def _verify(key_of, tx_hash, sender, signature):
+    """
+    Verifies one signature
+
+    :param key_of: Function returning the parsed verify key of a sender
+    :param tx_hash: Raw transaction hash, the signature is made over its hex
+    :param sender: Raw public key of the sender
+    :param signature: Raw signature
+    :return: True or False
+    """
+
+    try:
+        key_of(sender).verify(tx_hash.hex().encode(), signature)
+    except (nacl.exceptions.BadSignatureError, TypeError, ValueError):
+        return False
+    return True
+
+
+def _worker_key(sender):
+    verify_key = _worker_keys.get(sender)
+    if verify_key is None:
+        verify_key = _worker_keys[sender] = nacl.signing.VerifyKey(sender)
+    return verify_key
+
+
+def _verify_chunk(items):
+    if len(_worker_keys) > 100000:
+        _worker_keys.clear()
+    return [_verify(_worker_key, *item) for item in items]
+
+
+class SignatureVerifier():
+    """
+    Checks transaction signatures in batches.
+
+    libsodium has no batch Ed25519 verification, so a batch saves work by
+    parsing each sender's verify key once, skipping transactions that were
+    already verified (e.g. when a tx moves from the mempool into a block)
+    and, for large batches, splitting the signatures across processes.
+
+    The caches are shared by the node's threads and guarded by a lock, the
+    signatures themselves are checked outside of it.
+    """
+
+    def __init__(self, processes=0, cache_size=200000, key_cache_size=20000):
+        """
+        :param processes: Size of the process pool, 0 to verify in this process
+        :param cache_size: Amount of verified transactions to remember
+        :param key_cache_size: Amount of parsed verify keys to keep
+        """
+
+        self.processes = processes
+        self.cache_size = cache_size
+        self.key_cache_size = key_cache_size
+        self.keys = OrderedDict() # sender -> VerifyKey
+        self.verified = OrderedDict() # (hash, sender, signature) of verified transactions
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def signed_data(self, transaction):
+        if transaction.raw_signature is None or transaction.raw_sender is None:
+            return None
+        return (transaction.raw_hash, transaction.raw_sender, transaction.raw_signature)
+
+    def verify_key(self, sender):
+        """
+        :param sender: Raw public key
+        :return: Parsed VerifyKey, from the cache if it was parsed before
+        """
+
+        with self.lock:
+            verify_key = self.keys.get(sender)
+            if verify_key is not None:
+                self.keys.move_to_end(sender)
+                return verify_key
+
+        verify_key = nacl.signing.VerifyKey(sender)
+        with self.lock:
+            self.keys[sender] = verify_key
+            if len(self.keys) > self.key_cache_size:
+                self.keys.popitem(last=False)
+        return verify_key
+
+    def is_verified(self, key):
+        with self.lock:
+            if key in self.verified:
+                self.verified.move_to_end(key)
+                return True
+            return False
+
+    def remember(self, keys):
+        with self.lock:
+            for key in keys:
+                self.verified[key] = True
+            while len(self.verified) > self.cache_size:
+                self.verified.popitem(last=False)
+
+    def verify(self, transaction):
+        """
+        Checks the signature of one transaction
+
+        :param transaction: The transaction
+        :return: True if the signature is valid
+        """
+
+        key = self.signed_data(transaction)
+        if key is None:
+            return False
+        if self.is_verified(key):
+            return True
+
+        valid = _verify(self.verify_key, *key)
+        if valid:
+            self.remember([key])
+        return valid
+
+    def verify_batch(self, transactions):
+        """
+        Checks the signatures of many transactions together
+
+        :param transactions: List of transactions, miner rewards are skipped
+        :return: List of bools, True where the signature is valid
+        """
+
+        results = [True] * len(transactions)
+        pending = [] # (position, key) of transactions that still need verifying
+
+        for i, transaction in enumerate(transactions):
+            if transaction.raw_sender is None: #Miner reward
+                continue
+
+            key = self.signed_data(transaction)
+            if key is None:
+                results[i] = False
+            elif not self.is_verified(key):
+                pending.append((i, key))
+
+        if self.processes > 1 and len(pending) >= POOL_THRESHOLD:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(self.processes)
+
+            size = -(-len(pending) // self.processes)
+            chunks = [
+                [key for i, key in pending[start:start + size]]
+                for start in range(0, len(pending), size)
+                ]
+            valid = [v for chunk in self.executor.map(_verify_chunk, chunks) for v in chunk]
+        else:
+            valid = [_verify(self.verify_key, *key) for i, key in pending]
+
+        for (i, key), ok in zip(pending, valid):
+            results[i] = ok
+        self.remember([key for (i, key), ok in zip(pending, valid) if ok])
+
+        return results
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
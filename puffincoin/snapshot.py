@@ -0,0 +1,62 @@
+class ChainSnapshot():
+    """
+    Read-only view of the chain as it was when the snapshot was taken.
+
+    Blockchain only ever appends to its chain list; a reorg builds a new
+    list. So the first height blocks of a list never change, and a snapshot
+    only needs the list and its length instead of a copy.
+    """
+
+    __slots__ = ("blocks", "height")
+
+    def __init__(self, blocks, height=None):
+        """
+        :param blocks: The chain list
+        :param height: Amount of blocks in the snapshot, default all of them
+        """
+
+        self.blocks = blocks
+        self.height = len(blocks) if height is None else height
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.height)
+            if step == 1:
+                return self.blocks[start:stop]
+            return [self.blocks[i] for i in range(start, stop, step)]
+
+        if index < 0:
+            index += self.height
+        if not 0 <= index < self.height:
+            raise IndexError("block index out of range")
+        return self.blocks[index]
+
+    def __iter__(self):
+        blocks = self.blocks
+        for i in range(self.height):
+            yield blocks[i]
+
+    def iter_json(self, encode, start=0, stop=None):
+        """
+        Encodes a range of blocks one at a time
+
+        :param encode: Function converting a Block to json bytes
+        :param start: Height of the first block
+        :param stop: Height after the last block, default the tip
+        :return: Generator of json bytes
+        """
+
+        stop = self.height if stop is None else min(stop, self.height)
+        block_json = getattr(self.blocks, "block_json", None)
+        for i in range(max(start, 0), stop):
+            if block_json is not None:
+                yield block_json(i, encode)
+            else:
+                yield encode(self.blocks[i])
+
+    @property
+    def tip(self):
+        return self.blocks[self.height - 1]
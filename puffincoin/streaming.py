@@ -0,0 +1,178 @@
+import codecs
+import json
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+
+
+def choose_encoding(accept_encoding):
+    """
+    Picks a compression for a response from an Accept-Encoding header
+
+    :param accept_encoding: Header value, may be None
+    :return: "gzip", "deflate" or None
+    """
+
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    for encoding in ("gzip", "deflate"):
+        if accepted.get(encoding, 0) > 0:
+            return encoding
+    return None
+
+
+def compress(chunks, encoding):
+    """
+    Compresses a stream of byte chunks
+
+    :param chunks: Iterable of bytes
+    :param encoding: "gzip", "deflate" or None for no compression
+    :return: Generator of bytes
+    """
+
+    if encoding is None:
+        yield from chunks
+        return
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31 if encoding == "gzip" else 15)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_json(data):
+    """
+    :param data: json data
+    :return: Compact json bytes
+    """
+
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def json_list(items, encode, head=b"[", tail=b"]"):
+    """
+    Encodes a json list one item at a time
+
+    :param items: Iterable of objects
+    :param encode: Function converting an object to json bytes
+    :param head: Bytes before the first item
+    :param tail: Bytes after the last item
+    :return: Generator of bytes chunks of about CHUNK_SIZE
+    """
+
+    buffer = [head]
+    size = len(head)
+    first = True
+    for item in items:
+        data = encode(item)
+        if not first:
+            buffer.append(b",")
+        buffer.append(data)
+        size += len(data) + 1
+        first = False
+
+        if size >= CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+
+    buffer.append(tail)
+    yield b"".join(buffer)
+
+
+class JSONListParser():
+    """
+    Decodes the items of a json list while its bytes arrive.
+
+    The first "[" in the data starts the list, so a list wrapped in an
+    object like {"chain": [...]} is parsed as well.
+    """
+
+    def __init__(self, convert=None):
+        """
+        :param convert: Function applied to each decoded item, optional
+        """
+
+        self.convert = convert
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.started = False
+        self.done = False
+
+    def feed(self, data):
+        """
+        Adds data to the parser
+
+        :param data: bytes
+        :return: List of items completed by the data
+        """
+
+        self.buffer += self.text.decode(data)
+        items = []
+
+        if not self.started:
+            start = self.buffer.find("[")
+            if start == -1:
+                return items
+            self.buffer = self.buffer[start + 1:]
+            self.started = True
+
+        position = 0
+        while not self.done:
+            while position < len(self.buffer) and self.buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(self.buffer):
+                break
+
+            if self.buffer[position] == "]":
+                self.done = True
+                position += 1
+                break
+
+            try:
+                item, end = self.decoder.raw_decode(self.buffer, position)
+            except json.JSONDecodeError:
+                break #Item is not complete yet
+
+            items.append(self.convert(item) if self.convert else item)
+            position = end
+
+        self.buffer = self.buffer[position:]
+        return items
+
+    def close(self):
+        """
+        Checks that the whole list was received
+
+        :return: None
+        """
+
+        if not self.done:
+            raise ValueError("json list is incomplete or invalid")
+
+
+def parse_json_list(chunks, convert=None):
+    """
+    Decodes the items of a json list from a stream of byte chunks
+
+    :param chunks: Iterable of bytes
+    :param convert: Function applied to each decoded item, optional
+    :return: Generator of items
+    """
+
+    parser = JSONListParser(convert)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    parser.close()
@@ -1,19 +1,28 @@
-import hashlib
 import time
 
+from puffincoin.blockchain import Block, Transaction
+from puffincoin.encoding import now
+from puffincoin.miner import search
+
 class Utils():
-    def test_hashrate():
-        timeout = time.time() + 1
+    def test_hashrate(seconds=1):
+        """
+        Measures block hashing attempts per second on one core, with the
+        same midstate search the miner uses
 
-        nonse = 0
-        hashes = 0
+        :param seconds: How long to measure
+        :return: Attempts per second
+        """
 
-        while True:
-            if time.time() >= timeout:
-                break
+        block = Block([Transaction("Miner Reward", "00" * 32, 5)], now(), 1)
+        block.prev = "00" * 32
+        midstate = block.header_midstate()
+        target = bytes(32) #No hash is this low, so every attempt is made
 
-            nonse += 1
-            hashlib.sha256(str(nonse).encode())
-            hashes += 1
+        attempts = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            found, tried = search(midstate, target, attempts, 1, 10000)
+            attempts += tried
 
-        return hashes
\ No newline at end of file
+        return attempts / (time.perf_counter() - start)
@@ -0,0 +1,291 @@
+from puffincoin.difficulty import RETARGET_VERSION, Retarget, hash_value
+from puffincoin.encoding import now
+
+BATCH_BLOCKS = 200 #Blocks whose signatures are verified together
+BLOCK_VERSION = 4 #Version of new blocks, 2 commits to the Merkle root of the transactions, 3 to the target
+NONCE_VERSION = 4 #First block version whose transfers need nonces
+MEDIAN_TIME_BLOCKS = 11 #Blocks whose median time a new block has to be later than
+MAX_FUTURE_TIME = 2 * 60 * 60 #Most seconds a block time can be ahead of the clock
+
+class ValidationResult():
+    def __init__(self, valid, height=None, reason="", transaction=None):
+        self.valid = valid
+        self.height = height
+        self.reason = reason
+        self.transaction = transaction #The transaction that is not valid, if it was one
+
+    def __bool__(self):
+        return self.valid
+
+    def __str__(self):
+        if self.valid:
+            return "valid"
+        return f"block {self.height}: {self.reason}"
+
+
+class ChainValidator():
+    """
+    Validates a chain in a single pass.
+
+    The chain is replayed once from its first block while keeping running
+    balances, so every transaction is checked against the state of the chain
+    being validated and the whole check is linear in its transactions.
+    Signatures are checked ahead of each window of blocks in one batch.
+    """
+
+    def __init__(self, miner_reward, verifier=None, retarget=None):
+        self.miner_reward = miner_reward
+        self.verifier = verifier
+        self.retarget = retarget or Retarget()
+
+    def validate(self, chain):
+        """
+        Checks if a whole chain is valid
+
+        :param chain: The chain to be validated, starting at the genesis block
+        :return: ValidationResult
+        """
+
+        if len(chain) == 0:
+            return ValidationResult(False, 0, "chain is empty")
+
+        #Every node mints its own genesis block, so it cannot be trusted to credit anyone
+        genesis = chain[0]
+        if genesis.index != 0 or genesis.prev != "":
+            return ValidationResult(False, 0, "genesis block is not valid")
+        if genesis.transactions:
+            return ValidationResult(False, 0, "genesis block has transactions")
+
+        return self.validate_blocks(chain[1:], genesis, lambda address: 0, None, chain.__getitem__)
+
+    def validate_blocks(self, blocks, parent, balance_of, balances=None, block_at=None, nonce_of=None):
+        """
+        Checks if blocks are valid on top of an already trusted block
+
+        :param blocks: The blocks to be validated, in order
+        :param parent: The block the first block builds on
+        :param balance_of: Function returning the balance of an address at parent
+        :param balances: Running balances of addresses that changed since parent (dict)
+        :param block_at: Function returning a trusted block by height, needed for retargeting
+        :param nonce_of: Function returning the next nonce of an address at parent, default 0
+        :return: ValidationResult
+        """
+
+        if balances is None:
+            balances = {}
+        if nonce_of is None:
+            nonce_of = lambda address: 0
+        nonces = {} # address -> next nonce, for addresses that sent since parent
+        block_at = self.lookup(blocks, parent, block_at)
+
+        last_block = parent
+        for i, block in enumerate(blocks):
+            if self.verifier is not None and i % BATCH_BLOCKS == 0:
+                self.verifier.verify_batch([
+                    transaction for window_block in blocks[i:i + BATCH_BLOCKS] for transaction in window_block.transactions
+                    ])
+
+            reason = self.check_block(block, last_block, block_at)
+            if reason:
+                return ValidationResult(False, block.index, reason)
+
+            reason = self.check_rewards(block)
+            if reason:
+                return ValidationResult(False, block.index, reason)
+
+            #The reward of a version 4 block also holds the fees of the block
+            reward_limit = self.miner_reward
+            if block.version >= NONCE_VERSION:
+                reward_limit += sum(transaction.fee for transaction in block.transactions)
+
+            for transaction in block.transactions:
+                balance = balances.get(transaction.sender)
+                if balance is None:
+                    balance = balance_of(transaction.sender)
+
+                reason = transaction.check(balance, reward_limit, self.verifier)
+                if not reason:
+                    reason = self.check_nonce(transaction, block, nonces, nonce_of)
+                if reason:
+                    return ValidationResult(False, block.index, f"transaction {transaction.hash}: {reason}", transaction)
+
+                self.apply(transaction, balances, balance_of)
+
+            last_block = block
+
+        return ValidationResult(True)
+
+    def validate_headers(self, headers, parent, block_at=None):
+        """
+        Checks that headers link up and carry enough proof of work, without
+        their transactions
+
+        :param headers: BlockHeaders, in order
+        :param parent: Block or BlockHeader the first header builds on
+        :param block_at: Function returning a trusted block by height, needed for retargeting
+        :return: ValidationResult
+        """
+
+        block_at = self.lookup(headers, parent, block_at)
+
+        last = parent
+        for header in headers:
+            if header.index != last.index + 1:
+                return ValidationResult(False, header.index, "index is not valid")
+
+            if header.raw_prev != last.raw_hash:
+                return ValidationResult(False, header.index, "previous hash does not match")
+
+            if not 1 <= header.version <= BLOCK_VERSION:
+                return ValidationResult(False, header.index, "unknown block version")
+
+            #Version 1 hashes cover every transaction hash, they are checked once the block arrives
+            if header.version >= 2 and header.hash != header.hash_header():
+                return ValidationResult(False, header.index, "block hash is not valid")
+
+            reason = self.check_work(header, last, block_at)
+            if reason:
+                return ValidationResult(False, header.index, reason)
+
+            last = header
+
+        return ValidationResult(True)
+
+    def lookup(self, blocks, parent, block_at):
+        """
+        :return: Function returning blocks by height, from blocks or else from block_at
+        """
+
+        first = parent.index + 1
+
+        def get(height):
+            if height >= first:
+                return blocks[height - first]
+            if block_at is None:
+                raise IndexError("block %d is not available" % height)
+            return block_at(height)
+
+        return get
+
+    def check_block(self, block, parent, block_at):
+        """
+        Checks everything about a block except its transactions
+
+        :param block: The block
+        :param parent: The block it builds on
+        :param block_at: Function returning earlier blocks by height
+        :return: Reason the block is not valid, or ""
+        """
+
+        if block.index != parent.index + 1:
+            return "index is not valid"
+
+        if block.prev != parent.hash:
+            return "previous hash does not match"
+
+        if not 1 <= block.version <= BLOCK_VERSION:
+            return "unknown block version"
+
+        if block.version >= 2 and len(set(tx.raw_hash for tx in block.transactions)) != len(block.transactions):
+            #A repeated last transaction would not change the Merkle root
+            return "transaction is repeated"
+
+        if block.hash != block.hash_block():
+            return "block hash is not valid"
+
+        return self.check_work(block, parent, block_at)
+
+    def check_work(self, block, parent, block_at):
+        """
+        Checks the version, target and proof of work of a block
+
+        :param block: Block or BlockHeader
+        :param parent: Block or BlockHeader it builds on
+        :param block_at: Function returning earlier blocks by height
+        :return: Reason the block is not valid, or ""
+        """
+
+        if block.version < parent.version and parent.index > 0:
+            return "version is lower than its parent's"
+
+        if block.target != self.retarget.expected_target(block, parent, block_at):
+            return "target is not valid"
+
+        if hash_value(block.raw_hash) > block.target:
+            return "not enough proof of work"
+
+        #Older blocks hold local time, only UTC block times can be compared
+        if block.version >= RETARGET_VERSION:
+            if block.timestamp <= self.median_time(parent, block_at):
+                return "time is not later than the median of the last blocks"
+
+            if block.timestamp > now() + MAX_FUTURE_TIME:
+                return "time is too far in the future"
+
+        return ""
+
+    def median_time(self, parent, block_at):
+        """
+        :param parent: Block or BlockHeader a new block builds on
+        :param block_at: Function returning earlier blocks by height
+        :return: Median timestamp of the parent and the blocks before it, a new block has to be later.
+            Blocks older than version 3 hold local time and are left out, 0 if no block is left
+        """
+
+        first = max(parent.index - MEDIAN_TIME_BLOCKS + 1, 0)
+        blocks = [block_at(height) for height in range(first, parent.index)] + [parent]
+        times = sorted(block.timestamp for block in blocks if block.version >= RETARGET_VERSION)
+        if not times:
+            return 0
+        return times[len(times) // 2]
+
+    def check_rewards(self, block):
+        """
+        Checks that a version 4 block has exactly one reward, as its first
+        transaction. Older blocks can hold several rewards of at most the
+        miner reward each.
+
+        :return: Reason the rewards are not valid, or ""
+        """
+
+        if block.version < NONCE_VERSION:
+            return ""
+
+        rewards = sum(1 for transaction in block.transactions if transaction.raw_sender is None)
+        if rewards != 1 or block.transactions[0].raw_sender is not None:
+            return "block needs exactly one reward, as its first transaction"
+        return ""
+
+    def check_nonce(self, transaction, block, nonces, nonce_of):
+        """
+        Checks that a transfer uses the next nonce of its sender, and counts it
+
+        :return: Reason the nonce is not valid, or ""
+        """
+
+        if transaction.raw_sender is None:
+            return ""
+
+        if transaction.nonce is None:
+            if block.version >= NONCE_VERSION:
+                return "transaction has no nonce"
+            return ""
+
+        sender = transaction.sender
+        nonce = nonces.get(sender)
+        if nonce is None:
+            nonce = nonce_of(sender)
+        if transaction.nonce != nonce:
+            return "nonce is not the sender's next nonce"
+
+        nonces[sender] = nonce + 1
+        return ""
+
+    def apply(self, transaction, balances, balance_of):
+        amount = transaction.amount
+
+        for address, change in ((transaction.sender, -amount - transaction.fee), (transaction.reciever, amount)):
+            balance = balances.get(address)
+            if balance is None:
+                balance = balance_of(address)
+            balances[address] = balance + change
@@ -0,0 +1,146 @@
+import os
+import threading
+from collections import OrderedDict
+
+from puffincoin.blockchain import BlockHeader
+from puffincoin.streaming import encode_json
+
+
+class ViewCache():
+    """
+    Serialized json of blocks and of the mempool, kept between requests.
+
+    A mined block never changes, so its json is encoded once and reused by
+    every /chain and /blocks response. The mempool json is reused until the
+    mempool version changes. Each view has an ETag so peers polling an
+    unchanged node get a 304 without anything being encoded or sent.
+    Compressed responses are kept by ETag, since compressing costs more
+    than encoding.
+    """
+
+    def __init__(self, blockchain, max_blocks=50000, max_bodies=8, max_body_size=64 * 2 ** 20):
+        """
+        :param blockchain: The blockchain served by the node
+        :param max_blocks: Amount of encoded blocks to keep
+        :param max_bodies: Amount of compressed responses to keep
+        :param max_body_size: Largest compressed response to keep, in bytes
+        """
+
+        self.blockchain = blockchain
+        self.max_blocks = max_blocks
+        self.max_bodies = max_bodies
+        self.max_body_size = max_body_size
+        self.blocks = OrderedDict() # raw block hash -> json bytes
+        self.headers = OrderedDict() # raw block hash -> header json bytes
+        self.bodies = OrderedDict() # ETag -> compressed response body
+        self.transactions = (None, b"[]") # (mempool version, json bytes)
+        self.instance = os.urandom(4).hex() #Mempool versions restart at 0 with the node
+        self.lock = threading.Lock()
+
+    def block_json(self, block):
+        """
+        :param block: A mined block
+        :return: json bytes of the block
+        """
+
+        with self.lock:
+            data = self.blocks.get(block.raw_hash)
+            if data is not None:
+                self.blocks.move_to_end(block.raw_hash)
+                return data
+
+        data = encode_json(self.blockchain.block_to_json(block))
+        with self.lock:
+            self.blocks[block.raw_hash] = data
+            while len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+        return data
+
+    def header_json(self, block):
+        """
+        :param block: A mined block
+        :return: json bytes of the block's header
+        """
+
+        with self.lock:
+            data = self.headers.get(block.raw_hash)
+            if data is not None:
+                self.headers.move_to_end(block.raw_hash)
+                return data
+
+        data = encode_json(self.blockchain.header_to_json(BlockHeader.from_block(block)))
+        with self.lock:
+            self.headers[block.raw_hash] = data
+            while len(self.headers) > self.max_blocks:
+                self.headers.popitem(last=False)
+        return data
+
+    def get_body(self, etag):
+        """
+        :param etag: ETag of a compressed response
+        :return: The saved body, or None
+        """
+
+        with self.lock:
+            body = self.bodies.get(etag)
+            if body is not None:
+                self.bodies.move_to_end(etag)
+            return body
+
+    def save_body(self, etag, chunks):
+        """
+        Passes a response body through, saving it once it was sent completely
+
+        :param etag: ETag of the response
+        :param chunks: Iterable of bytes
+        :return: Generator of the same bytes
+        """
+
+        saved = []
+        size = 0
+        for chunk in chunks:
+            if size <= self.max_body_size:
+                saved.append(chunk)
+                size += len(chunk)
+            yield chunk
+
+        if size <= self.max_body_size:
+            with self.lock:
+                self.bodies[etag] = b"".join(saved)
+                while len(self.bodies) > self.max_bodies:
+                    self.bodies.popitem(last=False)
+
+    def transactions_json(self):
+        """
+        :return: (ETag, json bytes) of the pending transactions
+        """
+
+        mempool = self.blockchain.mempool
+        version, data = self.transactions
+        if version != mempool.version:
+            version = mempool.version #Read before encoding, so the data is never older than its version
+            data = encode_json(self.blockchain.pending_transactions_json())
+            self.transactions = (version, data)
+
+        return f"tx-{self.instance}-{version}", data
+
+    def chain_etag(self, chain, encoding=None):
+        """
+        :param chain: The chain being served
+        :param encoding: Content encoding of the response
+        :return: ETag of the whole chain
+        """
+
+        return f"chain-{len(chain)}-{chain[-1].hash}-{encoding or 'identity'}"
+
+    def blocks_etag(self, chain, start, limit, encoding=None, kind="blocks"):
+        """
+        :param chain: The chain being served
+        :param start: Height of the first block
+        :param limit: Most blocks in the response
+        :param kind: "blocks" or "headers"
+        :return: ETag of a range of blocks
+        """
+
+        #The tip hash changes with any new block or reorg, so it covers every range
+        return f"{kind}-{start}-{limit}-{len(chain)}-{chain[-1].hash}-{encoding or 'identity'}"
@@ -41,7 +41,10 @@ file_names = os.listdir("temp")
 for f in file_names: #Coppy files into main dir
     if not f == "puffincoin":
         print("COPPYING: " + f)
-        shutil.copy(os.path.join("temp", f), cwd)
+        if os.path.isdir(os.path.join("temp", f)): #e.g. benchmarks
+            shutil.copytree(os.path.join("temp", f), os.path.join(cwd, f), dirs_exist_ok=True)
+        else:
+            shutil.copy(os.path.join("temp", f), cwd)
     
 file_names_2 = os.listdir("temp/puffincoin")
 for f in file_names_2: